@@ -1,9 +1,23 @@
+import time
+_RERUN_START = time.perf_counter()
+
 import streamlit as st
-import chromadb
 import numpy as np
 import uuid # Per generare ID unici
-from sentence_transformers import SentenceTransformer # Importa la libreria per gli embedding
 import os # Per operazioni sul file system
+import json
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.utils_embeddings import encode_texts
+from src.utils.utils_embedding_cache import EmbeddingCache
+from src.utils.utils_encoders import load_encoder, encoder_cache_name
+from src.matching.shortlist import ResumeShortlist, shortlist_path
+from src.matching.matcher import find_matches
+from src.matching.lexical_index import LexicalIndex, lexical_index_path
+from src.utils.utils_query_cache import QueryCache, query_cache_key
+from src.utils.utils_metadata import build_where
+from src.utils.utils_chromadb import read_write_stamp
+from src.utils.utils_compression import PCAProjection, projection_path
+from src.utils.utils_metrics import METRICS, log_event, configure_from_env, write_prometheus_file
 
 # Tentativo di importare python-docx per i file .docx
 try:
@@ -22,52 +36,230 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
+# --- Metriche (endpoint Prometheus e log JSON attivati dalle variabili d'ambiente) ---
+METRICS_FILE = os.environ.get("JOB_MATCHER_METRICS_FILE")
+
+@st.cache_resource # Un solo endpoint /metrics per processo
+def start_metrics_export():
+    """
+    Avvia l'export delle metriche configurato da JOB_MATCHER_METRICS_PORT / JOB_MATCHER_JSON_LOG.
+    """
+    return configure_from_env()
+
+start_metrics_export()
+
 # --- Caricamento del modello di embedding ---
-@st.cache_resource # Memorizza in cache il modello per evitare di ricaricarlo ad ogni esecuzione
-def load_embedding_model():
+# Backend dell'encoder: sentence_transformers (fp32), multiprocess, quantized, onnx
+ENCODER_BACKEND = os.environ.get("JOB_MATCHER_ENCODER", "sentence_transformers")
+
+def _load_and_warm_up_model():
     """
-    Carica il modello di embedding SentenceTransformer.
+    Carica il modello (import di sentence_transformers/torch compresi) e fa un encode
+    di prova, così la prima query non paga l'inizializzazione.
     """
-    with st.spinner("Caricamento del modello di embedding 'all-mpnet-base-v2'... Questo potrebbe richiedere alcuni secondi al primo avvio."):
-        model = SentenceTransformer('all-mpnet-base-v2')
-    st.success("Modello di embedding caricato!")
+    start = time.perf_counter()
+    model = load_encoder(ENCODER_BACKEND, 'all-mpnet-base-v2')
+    loaded = time.perf_counter()
+    model.encode(["warm up"])
+    print(f"[timing] modello caricato in {loaded - start:.2f}s, warm-up {time.perf_counter() - loaded:.2f}s")
     return model
 
-# Carica il modello all'avvio dell'applicazione
-embedding_model = load_embedding_model()
+@st.cache_resource # Un solo caricamento per processo, in un thread in background
+def start_embedding_model_loading():
+    """
+    Avvia il caricamento del modello di embedding in background e restituisce il Future.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+    return executor.submit(_load_and_warm_up_model)
+
+def get_embedding_model():
+    """
+    Modello di embedding; attende il caricamento in background solo se non è ancora finito.
+    """
+    future = start_embedding_model_loading()
+    if not future.done():
+        with st.spinner(f"Caricamento del modello di embedding 'all-mpnet-base-v2' (backend {ENCODER_BACKEND})... Questo potrebbe richiedere alcuni secondi al primo avvio."):
+            return future.result()
+    return future.result()
+
+@st.cache_resource # Cache su disco (SQLite) condivisa con l'ingestion
+def load_embedding_cache():
+    """
+    Apre la cache persistente degli embedding usata anche in fase di ingestion.
+    """
+    return EmbeddingCache("./embedding_cache", encoder_cache_name("all-mpnet-base-v2", ENCODER_BACKEND))
+
+PROJECTION_PATH = projection_path("./chroma_db")
+
+@st.cache_resource # Proiezione PCA usata in ingestion, ricaricata quando il file cambia (mtime come chiave)
+def load_projection(mtime: float | None):
+    """
+    Proiezione da applicare alle query, None se le collezioni contengono gli embedding completi.
+    """
+    return PCAProjection.load(PROJECTION_PATH)
+
+# Avvia il caricamento del modello: la UI viene disegnata mentre il modello si carica
+model_future = start_embedding_model_loading()
+embedding_cache = load_embedding_cache()
+if model_future.done():
+    st.success("Modello di embedding caricato!")
+else:
+    st.info("Modello di embedding in caricamento in background...")
 
 # --- Funzione per la generazione degli Embedding (ora usa il modello reale) ---
 def get_embedding(text: str) -> list[float]:
     """
     Genera un embedding per il testo dato usando il modello 'all-mpnet-base-v2'.
+    Consulta prima la cache in memoria e poi quella su disco: il modello gira solo per testi mai visti.
+    Se le collezioni sono compresse, l'embedding viene proiettato come in ingestion.
     """
-    return embedding_model.encode(text).tolist()
+    # la chiave include la versione della proiezione: gli embedding in cache sono già proiettati
+    projection_mtime = os.path.getmtime(PROJECTION_PATH) if os.path.isfile(PROJECTION_PATH) else None
+    key = query_cache_key(text, projection_mtime)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = encode_texts(get_embedding_model(), [text], cache=embedding_cache)[0]
+        projection = load_projection(projection_mtime)
+        if projection is not None:
+            embedding = projection.transform(embedding)
+        embedding = embedding.tolist()
+        query_embedding_cache.put(key, embedding)
+    return embedding
 
 # --- Inizializzazione del client ChromaDB e delle collezioni ---
 # Usiamo un client persistente per connetterci al database esistente.
 # In un'applicazione di produzione, potresti connetterti a un server Chroma remoto.
-try:
-    client = chromadb.PersistentClient(path="./chroma_db")
-    st.success("Connesso a ChromaDB (modalità persistente).")
-except Exception as e:
-    st.error(f"Errore durante la connessione a ChromaDB: {e}")
-    st.stop() # Ferma l'esecuzione se non riusciamo a connetterci
+@st.cache_resource # Client e collezioni vengono creati una sola volta per processo
+def load_chroma_collections():
+    """
+    Connette ChromaDB e recupera le collezioni; restituisce anche il numero di elementi
+    letto all'avvio, usato solo per gli avvisi sulle collezioni vuote.
+    """
+    from src.utils.utils_sharding import open_client
 
-# Recupera le collezioni esistenti
-try:
+    start = time.perf_counter()
+    client = open_client("./chroma_db")
     job_posts_collection = client.get_or_create_collection(name="job_posts")
     resumes_collection = client.get_or_create_collection(name="resumes")
+    counts = {"job_posts": job_posts_collection.count(), "resumes": resumes_collection.count()}
+    print(f"[timing] ChromaDB pronto in {time.perf_counter() - start:.2f}s")
+    return client, job_posts_collection, resumes_collection, counts
+
+# Recupera le collezioni esistenti
+try:
+    client, job_posts_collection, resumes_collection, startup_counts = load_chroma_collections()
+    st.success("Connesso a ChromaDB (modalità persistente).")
     st.info("Collezioni 'job_posts' e 'resumes' caricate.")
-    
+
     # Verifica che le collezioni non siano vuote
-    if job_posts_collection.count() == 0:
+    if startup_counts["job_posts"] == 0:
         st.warning("Attenzione: La collezione 'job_posts' è vuota. Assicurati che il database sia stato popolato in precedenza.")
-    if resumes_collection.count() == 0:
+    if startup_counts["resumes"] == 0:
         st.warning("Attenzione: La collezione 'resumes' è vuota. Assicurati che il database sia stato popolato in precedenza.")
 
 except Exception as e:
-    st.error(f"Errore durante il recupero delle collezioni: {e}")
-    st.stop()
+    st.error(f"Errore durante la connessione a ChromaDB o il recupero delle collezioni: {e}")
+    st.stop() # Ferma l'esecuzione se non riusciamo a connetterci
+
+# --- Shortlist curriculum precalcolate in fase di ingestion ---
+SHORTLIST_PATH = shortlist_path("./chroma_db", "job_posts", "resumes")
+
+@st.cache_resource # Ricaricata solo quando il file cambia (mtime come chiave)
+def load_resume_shortlist(mtime: float):
+    """
+    Carica la shortlist job post -> curriculum calcolata da build_resume_shortlists.
+    """
+    return ResumeShortlist.load(SHORTLIST_PATH)
+
+def get_valid_shortlist():
+    """
+    Shortlist job post -> curriculum, oppure None se manca o non è più valida.
+    """
+    if not os.path.isfile(SHORTLIST_PATH):
+        return None
+    shortlist = load_resume_shortlist(os.path.getmtime(SHORTLIST_PATH))
+    if shortlist is None or not shortlist.is_valid(resumes_collection.count()):
+        return None
+    return shortlist
+
+# --- Indici lessicali per la ricerca ibrida (candidati BM25 + riordino con gli embedding) ---
+SEARCH_MODES = {"Vettoriale": "dense", "Ibrida (lessicale + vettoriale)": "hybrid"}
+
+@st.cache_resource # Ricaricato solo quando il file cambia (mtime come chiave)
+def load_lexical_index(collection_name: str, mtime: float):
+    """
+    Carica l'indice lessicale calcolato da build_lexical_indexes.
+    """
+    return LexicalIndex.load(lexical_index_path("./chroma_db", collection_name))
+
+def get_valid_lexical_index(collection):
+    """
+    Indice lessicale della collezione, oppure None se manca o non è più valido.
+    """
+    path = lexical_index_path("./chroma_db", collection.name)
+    if not os.path.isfile(path):
+        return None
+    index = load_lexical_index(collection.name, os.path.getmtime(path))
+    if index is None or not index.is_valid(collection.count()):
+        return None
+    return index
+
+# --- Cache delle query (condivisa da tutte le sessioni del processo) ---
+@st.cache_resource
+def load_query_caches():
+    """
+    Cache in memoria degli embedding delle descrizioni e dei risultati finali.
+    """
+    return QueryCache(max_entries=1024), QueryCache(max_entries=256, ttl_seconds=600)
+
+query_embedding_cache, query_result_cache = load_query_caches()
+
+def collections_version():
+    """
+    Versione delle collezioni: se cambia, i risultati in cache non sono più validi.
+    Oltre ai conteggi include i contrassegni di scrittura aggiornati dall'ingestion a ogni
+    inserimento, upsert, aggiornamento dei metadata o eliminazione.
+    """
+    index_files = [SHORTLIST_PATH] + [lexical_index_path("./chroma_db", name) for name in ("job_posts", "resumes")]
+    index_mtimes = tuple(os.path.getmtime(path) if os.path.isfile(path) else None for path in index_files)
+    write_stamps = tuple(read_write_stamp("./chroma_db", name) for name in ("job_posts", "resumes"))
+    return (job_posts_collection.count(), resumes_collection.count(), index_mtimes, write_stamps)
+
+def get_matches(job_description: str, n_resumes: int = 5, search_mode: str = "dense", where: dict | None = None):
+    """
+    Job post più simile e migliori curriculum per la descrizione, usando la cache dei risultati.
+    In modalità "hybrid" i candidati arrivano dagli indici lessicali (se disponibili);
+    where restringe la ricerca alle job post con i metadata indicati.
+    """
+    start = time.perf_counter()
+    key = query_cache_key(job_description, n_resumes, search_mode, json.dumps(where, sort_keys=True))
+    version = collections_version()
+    result = query_result_cache.get(key, version)
+    cached = result is not None
+    if cached:
+        METRICS.inc("query_cache_hits_total", mode=search_mode)
+    else:
+        lexical = {}
+        if search_mode == "hybrid":
+            lexical = {
+                "query_text": job_description,
+                "job_index": get_valid_lexical_index(job_posts_collection),
+                "resume_index": get_valid_lexical_index(resumes_collection),
+            }
+        with METRICS.time("query_seconds", stage="embedding", mode=search_mode):
+            query_embedding = get_embedding(job_description)
+        with METRICS.time("query_seconds", stage="search", mode=search_mode):
+            result = find_matches(
+                job_posts_collection, resumes_collection, query_embedding,
+                n_resumes=n_resumes, shortlist=get_valid_shortlist(), where=where, **lexical
+            )
+        query_result_cache.put(key, result, version)
+    seconds = time.perf_counter() - start
+    METRICS.observe("query_seconds", seconds, stage="total", mode=search_mode)
+    log_event("query", mode=search_mode, cached=cached, filtered=where is not None, n_resumes=n_resumes, seconds=round(seconds, 4))
+    if METRICS_FILE:
+        write_prometheus_file(METRICS_FILE)
+    return result
 
 # --- Funzione per visualizzare il contenuto del curriculum in base al tipo di file ---
 def display_resume_content(file_path: str):
@@ -111,6 +303,30 @@ def display_resume_content(file_path: str):
         st.info(f"Tipo di file non supportato per l'anteprima: {file_extension}")
         st.text(f"Percorso file: {file_path}")
 
+def display_resume_preview(resume_metadata: dict | None):
+    """
+    Visualizza l'anteprima salvata in ingestione (miniatura e testo estratto) senza
+    riaprire il file originale; per i curriculum indicizzati prima delle anteprime
+    ricade su display_resume_content.
+    """
+    resume_metadata = resume_metadata or {}
+    source = resume_metadata.get('source')
+    if not source:
+        st.warning("Percorso del curriculum non disponibile nei metadati.")
+        return
+    thumbnail = resume_metadata.get('thumbnail')
+    preview = resume_metadata.get('preview')
+    if not thumbnail and preview is None:
+        display_resume_content(source)
+        return
+
+    name = os.path.basename(source)
+    if thumbnail and os.path.exists(thumbnail):
+        st.image(thumbnail, caption=f"Anteprima immagine: {name}")
+    if preview is not None:
+        st.text_area(f"Testo estratto: {name}", preview, height=200, key=f"preview_{source}")
+    st.caption(f"Percorso file: {source}")
+
 
 # --- Interfaccia Utente ---
 st.title("🔍 Trova il Match Perfetto")
@@ -130,69 +346,58 @@ user_job_description = st.text_area(
 
 find_match_button = st.button("🚀 Trova match")
 
+search_mode = SEARCH_MODES.get(st.sidebar.radio("Modalità di ricerca", list(SEARCH_MODES)), "dense")
+if search_mode == "hybrid" and get_valid_lexical_index(job_posts_collection) is None:
+    st.sidebar.warning("Indici lessicali non disponibili: esegui build_lexical_indexes. Uso la ricerca vettoriale.")
+
+# Filtri sui metadata delle job post, applicati da Chroma prima della ricerca per similarità
+st.sidebar.markdown("**Filtri job post**")
+job_filters = build_where(
+    city=st.sidebar.text_input("Città"),
+    state=st.sidebar.text_input("Stato"),
+    category=st.sidebar.text_input("Categoria"),
+    min_salary=st.sidebar.number_input("Stipendio annuo minimo", min_value=0, value=None, step=1000),
+)
+
 st.markdown("---")
 
 # --- Logica di ricerca e visualizzazione ---
 if find_match_button and user_job_description:
     with st.spinner("Ricerca in corso..."):
-        # 1. Genera l'embedding per la job description dell'utente
-        user_embedding = get_embedding(user_job_description)
-
-        # 2. Trova la job post più simile nel database
         try:
             st.subheader("Risultati della Ricerca")
             st.write("Cercando la job post più simile alla tua...")
-            
-            # Query per la job post più simile
-            similar_job_posts = job_posts_collection.query(
-                query_embeddings=[user_embedding],
-                n_results=1,
-                include=['documents', 'metadatas', 'embeddings']
-            )
 
-            if similar_job_posts['documents']:
-                matched_job_post_text = similar_job_posts['documents'][0][0]
-                # Usa .get() con un valore di default per gestire il caso in cui 'job_title' non sia presente
-                matched_job_post_title = similar_job_posts['metadatas'][0][0].get('job_title', 'Titolo Sconosciuto')
-                matched_job_post_embedding = similar_job_posts['embeddings'][0][0]
+            # 1-3. Embedding della descrizione, job post più simile e migliori curriculum (con cache)
+            match = get_matches(user_job_description, n_resumes=5, search_mode=search_mode, where=job_filters)
 
+            if match is not None:
                 st.success("Job Post Trovata!")
                 st.markdown(f"### 🎯 Job Post più simile trovata:")
-                st.markdown(f"**Titolo:** {matched_job_post_title}")
-                st.markdown(f"**Descrizione:** {matched_job_post_text}")
+                st.markdown(f"**Titolo:** {match['job_post']['title']}")
+                st.markdown(f"**Descrizione:** {match['job_post']['text']}")
                 st.markdown("---")
 
-                # 3. Trova i 5 migliori curriculum simili alla job post trovata
-                st.write("Ora cerchiamo i 5 migliori curriculum per questa job post...")
-                
-                # ChromaDB restituisce i risultati già ordinati per distanza (dal più vicino al più lontano)
-                similar_resumes = resumes_collection.query(
-                    query_embeddings=[matched_job_post_embedding],
-                    n_results=5,
-                    include=['documents', 'metadatas', 'distances']
-                )
-
+                similar_resumes = match['resumes']
                 if similar_resumes['documents']:
                     st.markdown("### 📄 I 5 migliori Curriculum (dal più simile al meno simile):")
                     
-                    for i, (resume_doc, resume_metadata, distance) in enumerate(zip(
-                        similar_resumes['documents'][0],
-                        similar_resumes['metadatas'][0],
-                        similar_resumes['distances'][0]
+                    for i, (resume_metadata, distance) in enumerate(zip(
+                        similar_resumes['metadatas'],
+                        similar_resumes['distances']
                     )):
-                        # resume_doc sarà il percorso del file (es. 'data/Resumes Datasets/.../file.png')
-                        # resume_metadata sarà None, come da tua struttura
-                        
-                        # Poiché i metadati sono None, non possiamo estrarre un nome dal DB.
-                        # Potresti voler implementare una logica per inferire il nome dal percorso del file
-                        # o assicurarti che il DB contenga un campo 'name' nei metadati.
+                        # il percorso del file e l'anteprima sono nei metadati; il documento è il
+                        # testo estratto completo, usato solo per l'indice lessicale
+                        # Il DB non contiene un campo 'name' nei metadati.
                         resume_name = "Candidato Sconosciuto" # Default se non c'è un nome nei metadati
                         
                         st.markdown(f"**{i+1}. {resume_name}** (Distanza: {distance:.2f})")
-                        display_resume_content(resume_doc) # Chiama la funzione per visualizzare il contenuto del file
+                        display_resume_preview(resume_metadata) # Anteprima salvata in ingestione
                         st.markdown("---")
                 else:
                     st.warning("Nessun curriculum trovato per questa job post.")
+            elif job_filters:
+                st.warning("Nessuna job post trovata con i filtri selezionati.")
             else:
                 st.warning("Nessuna job post simile trovata nel database.")
         except Exception as e:
@@ -200,3 +405,8 @@ if find_match_button and user_job_description:
             st.info("Assicurati che le collezioni 'job_posts' e 'resumes' contengano dati e che la funzione `get_embedding` funzioni correttamente.")
 else:
     st.info("Incolla una descrizione di lavoro e clicca 'Trova match' per iniziare!")
+
+with st.sidebar.expander("Statistiche cache"):
+    st.json({"embedding_query": query_embedding_cache.stats(), "risultati": query_result_cache.stats(), "embedding_disco": embedding_cache.stats()})
+
+print(f"[timing] rerun completato in {time.perf_counter() - _RERUN_START:.2f}s")
@@ -0,0 +1,22 @@
+import os
+from src.benchmark.run import run_benchmark, compare_benchmarks
+
+JOB_POSTS_CSV = "./data/job_posts/marketing_sample_for_trulia_com-real_estate__20190901_20191031__30k_data.csv"
+
+
+def main():
+    # scala: "small" (2k job post / 200 curriculum), "medium" (20k / 2k) o "large" (200k / 20k)
+    run_benchmark(
+        scale="small",
+        workdir="./benchmark_work",
+        output_dir="./benchmark_results",
+        resume_formats=("ini", "docx", "png"),
+        # parità della pulizia HTML per colonna sulle descrizioni reali, se il CSV è presente
+        parity_csv_path=JOB_POSTS_CSV if os.path.isfile(JOB_POSTS_CSV) else None
+    )
+    # per confrontare due esecuzioni:
+    # print(compare_benchmarks("./benchmark_results/small_A.json", "./benchmark_results/small_B.json", min_change=0.05))
+
+
+if __name__ == "__main__":
+    main()
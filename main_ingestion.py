@@ -1,11 +1,23 @@
 from src.insertion.insert_job_post import insert_job_posts_to_chromadb
 from src.insertion.insert_resume import process_resumes_to_chroma, get_file_extensions
+from src.matching.shortlist import build_resume_shortlists
+from src.matching.lexical_index import build_lexical_indexes
+from src.utils.utils_metrics import configure_from_env, profiled, write_prometheus_file
 from pathlib import Path
 
 
 def main():
-    csv_file = "/Users/mc/Desktop/resume_matcher/data/job_posts/marketing_sample_for_trulia_com-real_estate__20190901_20191031__30k_data.csv"
-    insert_job_posts_to_chromadb(csv_file, collection_name='job_posts',overwrite=True)
+    # log JSON / endpoint /metrics se configurati (JOB_MATCHER_JSON_LOG, JOB_MATCHER_METRICS_PORT);
+    # con JOB_MATCHER_PROFILE_DIR l'intera ingestion viene profilata con cProfile
+    configure_from_env()
+    with profiled("ingestion"):
+        ingest()
+    write_prometheus_file("./metrics/ingestion.prom")
+
+
+def ingest():
+    csv_file = "./data/job_posts/marketing_sample_for_trulia_com-real_estate__20190901_20191031__30k_data.csv"
+    insert_job_posts_to_chromadb(csv_file, collection_name='job_posts',overwrite=True, dedup_threshold=0.9)
 
     root_directory = Path("./data/Resumes Datasets")
     
@@ -16,4 +28,19 @@ def main():
         root_dir=root_directory,
         collection_name="resumes",
         overwrite=True
-    )
\ No newline at end of file
+    )
+
+    # shortlist curriculum per ogni job post, servita dalla UI senza una seconda query
+    build_resume_shortlists(
+        chroma_db_path="./chroma_db",
+        job_collection="job_posts",
+        resume_collection="resumes",
+        top_n=20
+    )
+
+    # indici lessicali BM25 per la ricerca ibrida (candidati lessicali + riordino con gli embedding)
+    build_lexical_indexes(
+        chroma_db_path="./chroma_db",
+        job_collection="job_posts",
+        resume_collection="resumes"
+    )
@@ -0,0 +1,15 @@
+from src.benchmark.load_test import run_load_test
+
+
+def main():
+    # il servizio deve essere già avviato (python main_service.py)
+    run_load_test(
+        url="http://127.0.0.1:8765/match",
+        concurrency_levels=(1, 4, 16, 64),
+        n_requests=500,
+        output_path="./benchmark_results/load_test.json"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+from src.matching.bulk_match import run_bulk_matching
+
+
+def main():
+    run_bulk_matching(
+        chroma_db_path="./chroma_db",
+        job_collection="job_posts",
+        resume_collection="resumes",
+        k=5,
+        output_dir="./matches",
+        output_format="parquet"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from src.matching.exact_search import run_recall_check, run_compression_report
+
+
+def main():
+    run_recall_check(
+        chroma_db_path="./chroma_db",
+        collection_name="resumes",
+        query_collection="job_posts",
+        n_queries=200,
+        k=10
+    )
+    # recall di PCA e int8 rispetto ai vettori completi, per scegliere projection_dim
+    run_compression_report(
+        chroma_db_path="./chroma_db",
+        collection_name="resumes",
+        query_collection="job_posts",
+        dims=(256, 384),
+        k=10
+    )
+
+
+if __name__ == "__main__":
+    main()
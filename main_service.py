@@ -0,0 +1,19 @@
+from src.service.matching_service import run_service
+from src.utils.utils_metrics import configure_from_env
+
+
+def main():
+    # log JSON se configurati (JOB_MATCHER_JSON_LOG); le metriche sono anche su GET /metrics
+    configure_from_env()
+    run_service(
+        host="127.0.0.1",
+        port=8765,
+        chroma_db_path="./chroma_db",
+        max_batch_size=32,
+        max_wait_ms=5.0,
+        request_timeout=10.0
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import asyncio
+from urllib.parse import urlsplit
+
+from src.benchmark.synthetic import synthetic_queries
+from src.utils.utils_timing import latency_summary
+
+
+async def _post(reader, writer, host: str, path: str, payload: dict) -> int:
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _load_test(url: str, queries: list[str], concurrency: int, timeout: float, n_resumes: int, search_mode: str) -> dict:
+    parts = urlsplit(url)
+    host, port, path = parts.hostname, parts.port or 80, parts.path or "/match"
+    next_query = iter(range(len(queries)))
+    latencies, statuses = [], {}
+
+    async def client():
+        # una connessione keep-alive per client, come un recruiter che fa ricerche in sequenza
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in next_query:
+                start = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(
+                        _post(reader, writer, host, path, {"description": queries[i], "n_resumes": n_resumes, "search_mode": search_mode}),
+                        timeout
+                    )
+                except asyncio.TimeoutError:
+                    status = "client_timeout"
+                    writer.close()
+                    reader, writer = await asyncio.open_connection(host, port)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(queries),
+        "seconds": round(wall, 3),
+        "requests_per_second": round(len(queries) / wall, 2),
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "latency": latency_summary(latencies),
+    }
+
+
+def run_load_test(
+    url: str = "http://127.0.0.1:8765/match",
+    concurrency_levels=(1, 4, 16, 64),
+    n_requests: int = 500,
+    timeout: float = 30.0,
+    n_resumes: int = 5,
+    search_mode: str = "dense",
+    queries: list[str] | None = None,
+    output_path: str | None = None,
+    seed: int = 1
+) -> list[dict]:
+    """
+    Invia n_requests descrizioni (sintetiche se queries è None) al servizio di matching per ogni
+    livello di concorrenza e riporta throughput, latenze p50/p95/p99 e codici di risposta.
+    Con concorrenza 1 ogni richiesta è un batch da uno: è il riferimento per il guadagno del micro-batching.
+    """
+    queries = queries or synthetic_queries(n_requests, seed=seed)
+    reports = []
+    for concurrency in concurrency_levels:
+        report = asyncio.run(_load_test(url, queries[:n_requests], concurrency, timeout, n_resumes, search_mode))
+        print(f"Concorrenza {concurrency}: {report['requests_per_second']} req/s, "
+              f"p50 {report['latency'].get('p50_ms', float('nan')):.1f} ms, p99 {report['latency'].get('p99_ms', float('nan')):.1f} ms, "
+              f"esiti {report['statuses']}")
+        reports.append(report)
+    if output_path:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+    return reports
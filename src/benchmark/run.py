@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+from src.benchmark.synthetic import generate_job_posts_csv, generate_resume_tree, synthetic_queries
+from src.utils.utils_timing import StageTimings, latency_summary
+from src.utils.utils_metrics import METRICS
+
+# Scale predefinite: numero di job post, curriculum e query
+SCALES = {
+    "small": {"job_posts": 2_000, "resumes": 200, "queries": 200},
+    "medium": {"job_posts": 20_000, "resumes": 2_000, "queries": 500},
+    "large": {"job_posts": 200_000, "resumes": 20_000, "queries": 1_000},
+}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_extraction(root: Path, sample_per_format: int = 50) -> dict:
+    """Latenza di file_to_plain_text per formato, su al più sample_per_format file ciascuno."""
+    from src.utils.utils_resumes import file_to_plain_text
+
+    by_format = {}
+    for path in sorted(root.rglob("*")):
+        if path.is_file():
+            by_format.setdefault(path.suffix.lower().lstrip("."), []).append(path)
+
+    results = {}
+    for fmt, paths in by_format.items():
+        seconds, errors = [], 0
+        for path in paths[:sample_per_format]:
+            start = time.perf_counter()
+            try:
+                file_to_plain_text(str(path))
+            except Exception:
+                errors += 1
+            seconds.append(time.perf_counter() - start)
+        results[fmt] = {**latency_summary(seconds), "errors": errors}
+    return results
+
+
+def benchmark_clean_html(csv_path, sample_size: int = 2_000, seed: int = 0) -> dict:
+    """
+    Pulizia HTML di un campione di job_description dal CSV: tempi di clean_html_column e della
+    pulizia cella per cella, e parità tra le due (con e senza minuscole).
+    Solleva RuntimeError se i risultati differiscono.
+    """
+    from src.insertion.insert_job_post import iter_job_post_chunks
+    from src.utils.utils_job_posts import check_clean_html_parity, clean_html_and_normalize, clean_html_column
+
+    texts = next(iter_job_post_chunks(str(csv_path), chunk_size=None))["job_description"]
+    texts = texts.sample(n=min(sample_size, len(texts)), random_state=seed)
+    results = {"n_rows": int(len(texts))}
+    start = time.perf_counter()
+    texts.str.lower().apply(clean_html_and_normalize)
+    results["per_cell_seconds"] = round(time.perf_counter() - start, 4)
+    start = time.perf_counter()
+    clean_html_column(texts, lowercase=True)
+    results["column_seconds"] = round(time.perf_counter() - start, 4)
+
+    for lowercase in (False, True):
+        parity = check_clean_html_parity(texts, lowercase=lowercase)
+        if parity["n_mismatches"]:
+            raise RuntimeError(f"clean_html_column diverge da clean_html_and_normalize (lowercase={lowercase}): {parity}")
+    return results
+
+
+def benchmark_queries(chroma_db_path: str, queries: list[str], model, projection=None, n_resumes: int = 5) -> dict:
+    """
+    Latenze del flusso di matching di main.py (encode della descrizione + find_matches) per le
+    modalità disponibili: vettoriale, vettoriale con shortlist e ibrida con gli indici BM25.
+    Le cache delle query sono escluse: ogni query paga encode e ricerca.
+    """
+    from src.utils.utils_embeddings import encode_texts
+    from src.utils.utils_sharding import open_client
+    from src.matching.matcher import find_matches
+    from src.matching.shortlist import ResumeShortlist, shortlist_path
+    from src.matching.lexical_index import LexicalIndex, lexical_index_path
+
+    client = open_client(chroma_db_path)
+    job_posts = client.get_collection("job_posts")
+    resumes = client.get_collection("resumes")
+
+    encode_seconds, embeddings = [], []
+    for text in queries:
+        start = time.perf_counter()
+        embedding = encode_texts(model, [text])[0]
+        if projection is not None:
+            embedding = projection.transform(embedding)
+        embeddings.append(embedding.tolist())
+        encode_seconds.append(time.perf_counter() - start)
+
+    modes = {"dense": {}}
+    shortlist = ResumeShortlist.load(shortlist_path(chroma_db_path, "job_posts", "resumes"))
+    if shortlist is not None and shortlist.is_valid(resumes.count()):
+        modes["dense_shortlist"] = {"shortlist": shortlist}
+    job_index = LexicalIndex.load(lexical_index_path(chroma_db_path, "job_posts"))
+    resume_index = LexicalIndex.load(lexical_index_path(chroma_db_path, "resumes"))
+    if job_index is not None and resume_index is not None:
+        modes["hybrid"] = {"job_index": job_index, "resume_index": resume_index}
+
+    results = {"encode": latency_summary(encode_seconds)}
+    for mode, kwargs in modes.items():
+        search_seconds = []
+        for text, embedding in zip(queries, embeddings):
+            start = time.perf_counter()
+            find_matches(job_posts, resumes, embedding, n_resumes=n_resumes, query_text=text, **kwargs)
+            search_seconds.append(time.perf_counter() - start)
+        results[mode] = {
+            "search": latency_summary(search_seconds),
+            "total": latency_summary([e + s for e, s in zip(encode_seconds, search_seconds)]),
+        }
+    return results
+
+
+def run_benchmark(
+    scale: str | dict = "small",
+    workdir: str = "./benchmark_work",
+    output_dir: str = "./benchmark_results",
+    model_name: str = "all-mpnet-base-v2",
+    encoder_backend: str = "sentence_transformers",
+    resume_formats=("ini", "docx", "png"),
+    n_workers: int | None = None,
+    projection_dim: int | None = None,
+    build_indexes: bool = True,
+    extraction_sample: int = 50,
+    seed: int = 0,
+    keep_workdir: bool = False,
+    parity_csv_path: str | None = None
+) -> Path:
+    """
+    Benchmark end-to-end su dati sintetici: genera job post e curriculum nella scala indicata
+    ("small", "medium", "large" o un dict come quelli di SCALES), misura l'estrazione del testo,
+    gli stage dell'ingestion (a freddo, senza cache degli embedding) e le latenze delle query.
+    La parità della pulizia HTML per colonna viene verificata su un campione di parity_csv_path
+    (per esempio il CSV reale delle job post) o, se non indicato, del CSV sintetico.
+    Scrive i risultati in output_dir/<scala>_<timestamp>.json e restituisce il percorso.
+    """
+    from src.insertion.insert_job_post import insert_job_posts_to_chromadb
+    from src.insertion.insert_resume import process_resumes_to_chroma
+    from src.utils.utils_encoders import load_encoder, close_encoder
+    from src.utils.utils_compression import PCAProjection, projection_path
+
+    scale_name = scale if isinstance(scale, str) else "custom"
+    sizes = SCALES[scale] if isinstance(scale, str) else scale
+    workdir = Path(workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+    chroma_db_path = str(workdir / "chroma_db")
+    results = {}
+    METRICS.reset()
+
+    print(f"Benchmark '{scale_name}': {sizes}")
+    start = time.perf_counter()
+    csv_path = generate_job_posts_csv(workdir / "job_posts.csv", sizes["job_posts"], seed=seed)
+    resume_tree = generate_resume_tree(workdir / "resumes", sizes["resumes"], formats=resume_formats, seed=seed)
+    queries = synthetic_queries(sizes["queries"], seed=seed + 1)
+    results["generate"] = {"seconds": round(time.perf_counter() - start, 3), **resume_tree}
+    if resume_tree["skipped_formats"]:
+        print(f"Formati saltati (librerie mancanti): {resume_tree['skipped_formats']}")
+
+    results["extraction"] = benchmark_extraction(workdir / "resumes", extraction_sample)
+    results["clean_html"] = benchmark_clean_html(parity_csv_path or csv_path, seed=seed)
+
+    timings = StageTimings()
+    start = time.perf_counter()
+    insert_job_posts_to_chromadb(
+        str(csv_path), chroma_db_path=chroma_db_path, collection_name="job_posts", overwrite=True,
+        model_name=model_name, embedding_cache_dir=None, encoder_backend=encoder_backend,
+        projection_dim=projection_dim, stage_timings=timings
+    )
+    wall = time.perf_counter() - start
+    results["ingest_job_posts"] = {
+        "seconds": round(wall, 3), "rows_per_second": round(sizes["job_posts"] / wall, 2), "stages": timings.as_dict()
+    }
+
+    timings = StageTimings()
+    start = time.perf_counter()
+    errors = process_resumes_to_chroma(
+        workdir / "resumes", collection_name="resumes", model_name=model_name, overwrite=True,
+        embedding_cache_dir=None, n_workers=n_workers, thumbnail_dir=str(workdir / "thumbnails"),
+        error_report_path=str(workdir / "resume_errors.json"), encoder_backend=encoder_backend,
+        projection_dim=projection_dim, chroma_db_path=chroma_db_path, stage_timings=timings
+    )
+    wall = time.perf_counter() - start
+    results["ingest_resumes"] = {
+        "seconds": round(wall, 3), "files_per_second": round(sizes["resumes"] / wall, 2),
+        "errors": len(errors), "stages": timings.as_dict()
+    }
+
+    if build_indexes:
+        from src.matching.shortlist import build_resume_shortlists
+        from src.matching.lexical_index import build_lexical_indexes
+
+        start = time.perf_counter()
+        build_resume_shortlists(chroma_db_path=chroma_db_path, top_n=20)
+        results["build_shortlists"] = {"seconds": round(time.perf_counter() - start, 3)}
+        start = time.perf_counter()
+        build_lexical_indexes(chroma_db_path=chroma_db_path, n_workers=n_workers)
+        results["build_lexical_indexes"] = {"seconds": round(time.perf_counter() - start, 3)}
+
+    start = time.perf_counter()
+    model = load_encoder(encoder_backend, model_name)
+    model.encode(["warm up"])
+    results["model_load"] = {"seconds": round(time.perf_counter() - start, 3)}
+    try:
+        projection = PCAProjection.load(projection_path(chroma_db_path))
+        results["queries"] = benchmark_queries(chroma_db_path, queries, model, projection=projection)
+    finally:
+        close_encoder(model)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "scale": scale_name,
+            "sizes": sizes,
+            "model_name": model_name,
+            "encoder_backend": encoder_backend,
+            "projection_dim": projection_dim,
+            "seed": seed,
+        },
+        "results": results,
+        "metrics": METRICS.summary(),
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = Path(output_dir) / f"{scale_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if not keep_workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"Risultati del benchmark salvati in {output_path}")
+    return output_path
+
+
+def _flatten(value, prefix: str = "") -> dict:
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}.{key}" if prefix else key))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def compare_benchmarks(baseline_path, candidate_path, min_change: float = 0.0) -> dict:
+    """
+    Confronta due risultati di run_benchmark: per ogni metrica numerica comune restituisce
+    (baseline, candidate, candidate / baseline). Con min_change > 0 restano solo le metriche
+    cambiate almeno di quella frazione.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = _flatten(json.load(f)["results"])
+    with open(candidate_path, encoding="utf-8") as f:
+        candidate = _flatten(json.load(f)["results"])
+
+    comparison = {}
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[key], candidate[key]
+        ratio = after / before if before else (1.0 if after == before else None)
+        if ratio is None or abs(ratio - 1) >= min_change:
+            comparison[key] = {"baseline": before, "candidate": after, "ratio": ratio}
+    return comparison
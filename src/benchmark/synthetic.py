@@ -0,0 +1,186 @@
+import os
+import configparser
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+# Per i curriculum .docx
+try:
+    from docx import Document
+except ImportError:
+    Document = None
+
+# Per i curriculum .png renderizzati
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+    ImageDraw = None
+    ImageFont = None
+
+ROLES = [
+    "Real Estate Agent", "Property Manager", "Leasing Consultant", "Mortgage Loan Officer",
+    "Software Engineer", "Data Analyst", "Marketing Manager", "Sales Representative",
+    "Customer Service Specialist", "Administrative Assistant", "Accountant", "Project Manager",
+]
+SKILLS = [
+    "negotiation", "customer relationship management", "lead generation", "market analysis",
+    "python", "sql", "excel", "salesforce", "social media marketing", "budgeting",
+    "contract management", "property valuation", "team leadership", "public speaking",
+    "data visualization", "cold calling", "scheduling", "bookkeeping", "zoning regulations",
+]
+CITIES = [
+    ("New York", "NY"), ("Los Angeles", "CA"), ("Chicago", "IL"), ("Houston", "TX"),
+    ("Phoenix", "AZ"), ("San Francisco", "CA"), ("Seattle", "WA"), ("Miami", "FL"),
+    ("Denver", "CO"), ("Boston", "MA"),
+]
+CATEGORIES = ["Real Estate", "Sales", "Marketing", "Finance", "Technology", "Administration"]
+JOB_TYPES = ["Full Time", "Part Time", "Contract"]
+SENTENCES = [
+    "We are looking for a motivated {role} to join our growing team in {city}.",
+    "The ideal candidate has experience with {skill} and {skill2}.",
+    "You will work closely with clients & partners to deliver outstanding results.",
+    "Strong knowledge of {skill} is required; {skill2} is a plus.",
+    "We offer competitive pay, flexible hours and great benefits.",
+    "Responsibilities include {skill}, reporting and day-to-day coordination.",
+    "Join a company that values integrity, teamwork and growth.",
+]
+
+
+def _pick(rng, items):
+    return items[rng.integers(len(items))]
+
+
+def synthetic_job_description(rng, role: str, city: str, n_sentences: int) -> str:
+    """Descrizione HTML (paragrafi, <br>, liste ed entità) come quelle del dataset reale."""
+    sentences = [
+        _pick(rng, SENTENCES).format(role=role, city=city, skill=_pick(rng, SKILLS), skill2=_pick(rng, SKILLS))
+        for _ in range(n_sentences)
+    ]
+    bullets = "".join(f"<li>{_pick(rng, SKILLS).capitalize()}</li>" for _ in range(rng.integers(2, 6)))
+    half = len(sentences) // 2
+    return f"<p>{' '.join(sentences[:half])}</p><br/><ul>{bullets}</ul><br><p>{' '.join(sentences[half:])}</p>"
+
+
+def generate_job_posts_csv(path, n_rows: int, seed: int = 0, duplicate_rate: float = 0.05, min_sentences: int = 4, max_sentences: int = 30) -> Path:
+    """
+    Scrive un CSV di n_rows job post sintetiche con le colonne del dataset reale.
+    Una frazione duplicate_rate ripete la descrizione di una riga precedente (quasi duplicati).
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_rows):
+        role = _pick(rng, ROLES)
+        city, state = _pick(rng, CITIES)
+        if rows and rng.random() < duplicate_rate:
+            description = rows[rng.integers(len(rows))]["Job Description"] + " Apply today."
+        else:
+            description = synthetic_job_description(rng, role, city, int(rng.integers(min_sentences, max_sentences + 1)))
+        low = int(rng.integers(30, 90)) * 1000
+        rows.append({
+            "Uniq Id": f"job-{seed}-{i:08d}",
+            "Job Title": role,
+            "Job Description": description,
+            "Category": _pick(rng, CATEGORIES),
+            "City": city,
+            "State": state,
+            "Job Type": _pick(rng, JOB_TYPES),
+            "Salary Offered": _pick(rng, [f"${low:,} - ${low + 20000:,} a year", f"${low // 2000} - ${low // 2000 + 10} /hour", ""]),
+        })
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def synthetic_resume(rng, index: int) -> dict:
+    """Contenuto di un curriculum: sezioni con coppie chiave/valore."""
+    role = _pick(rng, ROLES)
+    city, state = _pick(rng, CITIES)
+    skills = sorted({_pick(rng, SKILLS) for _ in range(rng.integers(3, 9))})
+    return {
+        "personal": {"name": f"Candidate {index}", "city": f"{city}, {state}"},
+        "profile": {"title": role, "summary": f"{role} with {rng.integers(1, 20)} years of experience in {', '.join(skills[:2])}."},
+        "skills": {"list": ", ".join(skills)},
+        "experience": {
+            f"job{j}": f"{_pick(rng, ROLES)} at Company {rng.integers(1000)} ({2000 + j * 3}-{2003 + j * 3})"
+            for j in range(rng.integers(1, 5))
+        },
+    }
+
+
+def _resume_lines(resume: dict) -> list[str]:
+    lines = []
+    for section, values in resume.items():
+        lines.append(section.upper())
+        lines.extend(f"{key}: {value}" for key, value in values.items())
+        lines.append("")
+    return lines
+
+
+def _write_ini(path: Path, resume: dict):
+    config = configparser.ConfigParser()
+    for section, values in resume.items():
+        config[section] = {key: str(value) for key, value in values.items()}
+    with open(path, "w", encoding="utf-8") as f:
+        config.write(f)
+
+
+def _write_docx(path: Path, resume: dict):
+    document = Document()
+    for line in _resume_lines(resume):
+        document.add_paragraph(line)
+    document.save(path)
+
+
+def _write_png(path: Path, resume: dict):
+    try:
+        font = ImageFont.load_default(size=22)
+    except TypeError:  # Pillow < 10.1: solo il font bitmap di default
+        font = ImageFont.load_default()
+    lines = _resume_lines(resume)
+    image = Image.new("RGB", (1000, 80 + 32 * len(lines)), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((40, 40 + 32 * i), line, fill="black", font=font)
+    image.save(path)
+
+
+RESUME_WRITERS = {"ini": _write_ini, "docx": _write_docx, "png": _write_png}
+
+
+def available_resume_formats(formats) -> tuple[list[str], list[str]]:
+    """Separa i formati generabili da quelli che richiedono librerie non installate."""
+    missing = {"docx": Document is None, "png": Image is None}
+    usable = [f for f in formats if f in RESUME_WRITERS and not missing.get(f, False)]
+    return usable, [f for f in formats if f not in usable]
+
+
+def generate_resume_tree(root, n_resumes: int, formats=("ini", "docx", "png"), seed: int = 0) -> dict:
+    """
+    Crea n_resumes curriculum sintetici sotto root/<categoria>/, distribuiti a rotazione sui formati
+    disponibili. Restituisce {formato: numero di file} e i formati saltati.
+    """
+    rng = np.random.default_rng(seed)
+    usable, skipped = available_resume_formats(formats)
+    if not usable:
+        raise RuntimeError(f"Nessun formato di curriculum generabile tra {list(formats)}")
+    root = Path(root)
+    counts = {fmt: 0 for fmt in usable}
+    for i in range(n_resumes):
+        fmt = usable[i % len(usable)]
+        directory = root / _pick(rng, CATEGORIES).replace(" ", "_")
+        os.makedirs(directory, exist_ok=True)
+        RESUME_WRITERS[fmt](directory / f"resume_{i:07d}.{fmt}", synthetic_resume(rng, i))
+        counts[fmt] += 1
+    return {"files": counts, "skipped_formats": skipped}
+
+
+def synthetic_queries(n_queries: int, seed: int = 1) -> list[str]:
+    """Descrizioni di lavoro usate come query, diverse da quelle indicizzate (seed diverso)."""
+    rng = np.random.default_rng(seed)
+    return [
+        synthetic_job_description(rng, _pick(rng, ROLES), _pick(rng, CITIES)[0], int(rng.integers(3, 12)))
+        for _ in range(n_queries)
+    ]
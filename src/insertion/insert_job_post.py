@@ -1,82 +1,258 @@
+import threading
 import pandas as pd
-import numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-import chromadb
-from src.utils.utils_job_posts import clean_html_and_normalize
-from src.utils.utils_chromadb import create_collection, delete_collection, insert_points_batch
+from src.utils.utils_job_posts import clean_html_column
+from src.utils.utils_chromadb import create_collection, delete_collection, insert_points_batch, filter_existing_ids, update_metadatas
+from src.utils.utils_sharding import open_client
+from src.utils.utils_dedup import NearDuplicateIndex, dedup_index_path, invalidate_dedup_index
+from src.utils.utils_metadata import job_post_metadatas
+from src.utils.utils_compression import make_projector, projection_path, ProjectionFitError
+from src.utils.utils_timing import StageTimings, optional_timing, timed_iter
+from src.matching.shortlist import invalidate_shortlists
+from src.matching.lexical_index import invalidate_lexical_index
+from src.utils.utils_embeddings import encode_texts, PaddingStats
+from src.utils.utils_embedding_cache import EmbeddingCache
+from src.utils.utils_pipeline import run_pipeline
+from src.utils.utils_encoders import load_encoder, close_encoder, encoder_cache_name
 from tqdm import tqdm
 
+def iter_job_post_chunks(csv_path: str, chunk_size: int | None = 10_000):
+    """
+    Legge il CSV a blocchi di chunk_size righe (o tutto insieme se chunk_size è None)
+    normalizzando i nomi delle colonne.
+    """
+    if chunk_size is None:
+        chunks = [pd.read_csv(csv_path, low_memory=False)]
+    else:
+        chunks = pd.read_csv(csv_path, low_memory=False, chunksize=chunk_size)
+    for chunk in chunks:
+        chunk.columns = chunk.columns.str.lower().str.replace(' ', '_')
+        yield chunk
+
+def record_duplicates(client, collection_name: str, duplicates: dict, page_size: int = 1000):
+    """
+    Salva nei metadata di ogni rappresentante gli id dei suoi quasi duplicati
+    (duplicate_ids separati da virgola e duplicate_count).
+    """
+    rep_ids = list(duplicates)
+    collection = client.get_collection(collection_name)
+    for start in range(0, len(rep_ids), page_size):
+        page = collection.get(ids=rep_ids[start:start + page_size], include=["metadatas"])
+        metadatas = []
+        for rep_id, metadata in zip(page["ids"], page["metadatas"]):
+            metadata = dict(metadata or {})
+            previous = [i for i in str(metadata.get("duplicate_ids", "")).split(",") if i]
+            dup_ids = previous + [i for i in duplicates[rep_id] if i not in previous]
+            metadata["duplicate_ids"] = ",".join(dup_ids)
+            metadata["duplicate_count"] = len(dup_ids)
+            metadatas.append(metadata)
+        if metadatas:
+            update_metadatas(client, collection_name, ids=page["ids"], metadatas=metadatas)
+
+def load_dedup_index(client, chroma_db_path: str, collection_name: str, threshold: float, page_size: int = 1000) -> NearDuplicateIndex:
+    """
+    Indice dei quasi duplicati salvato dall'ultima ingestion. Se manca, ha parametri diversi
+    o la collezione è cambiata nel frattempo, viene ricostruito dai documenti (le descrizioni
+    pulite) e dai duplicate_ids salvati nei metadata della collezione.
+    """
+    collection = client.get_collection(collection_name)
+    count = collection.count()
+    index = NearDuplicateIndex.load(dedup_index_path(chroma_db_path, collection_name))
+    if index is not None and index.is_compatible(threshold) and index.is_valid(count):
+        return index
+    index = NearDuplicateIndex(threshold=threshold)
+    if count:
+        print(f"Ricostruzione dell'indice dei quasi duplicati da {count} job post...")
+    offset = 0
+    while offset < count:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        for _id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            index.add_representative(_id, document or "")
+            index.add_members(_id, [i for i in str((metadata or {}).get("duplicate_ids", "")).split(",") if i])
+        offset += len(page["ids"])
+    return index
+
 def insert_job_posts_to_chromadb(
     csv_path: str,
     chroma_db_path: str = "./chroma_db",
     collection_name: str = "job_posts",
     overwrite: bool = False,
     batch_size: int = 1000,
-    model_name: str = "all-mpnet-base-v2"
+    model_name: str = "all-mpnet-base-v2",
+    encode_batch_size: int = 64,
+    chunk_size: int | None = 10_000,
+    embedding_cache_dir: str | None = "./embedding_cache",
+    encoder_backend: str = "sentence_transformers",
+    pipeline_queue_size: int = 2,
+    dedup_threshold: float | None = None,
+    projection_dim: int | None = None,
+    stage_timings: StageTimings | None = None,
+    n_shards: int | None = None,
+    length_bucketing: bool = False
 ):
+    """
+    Indicizza le job post del CSV nella collezione.
+
+    Con dedup_threshold (es. 0.9) le job post quasi duplicate (Jaccard stimato con MinHash LSH
+    sui shingle della descrizione pulita) non vengono codificate: si inserisce solo il primo
+    rappresentante del gruppo e gli id degli altri finiscono nei suoi metadata, solo dopo che il
+    rappresentante è stato scritto. L'indice MinHash (firme dei rappresentanti e membri dei gruppi)
+    è salvato accanto al database, quindi una nuova esecuzione non reinserisce i duplicati già accorpati.
+
+    Con projection_dim (es. 384) gli embedding vengono ridotti con la proiezione PCA condivisa
+    del database (stimata sul primo chunk se non esiste ancora) prima di essere scritti.
+
+    stage_timings (StageTimings), se passato, raccoglie il tempo di ogni stage
+    (read, filter_existing, clean, dedup, encode, metadata, write).
+
+    Con n_shards > 1 una nuova collezione viene creata in n_shards shard (id assegnati per hash),
+    scritti in parallelo; una collezione esistente mantiene il suo layout salvo overwrite.
+
+    Con length_bucketing i batch dell'encoder sono formati per numero di token invece che
+    per caratteri; a fine run viene stampato il padding rispetto a SentenceTransformer.encode.
+    """
     path = Path(csv_path)
-    client = chromadb.PersistentClient(path=chroma_db_path)
+    client = open_client(chroma_db_path, n_shards=n_shards)
 
     if create_collection(client, collection_name) is None and overwrite:
         delete_collection(client, collection_name)
         create_collection(client, collection_name)
-    
-    collection = client.get_collection(collection_name)
-    ids = collection.get(limit=int(1e9))['ids']
-    
-    df = pd.read_csv(path, low_memory=False)
-    df.columns = df.columns.str.lower().str.replace(' ', '_')
-    
-    model = SentenceTransformer(model_name)
-    df['job_description'] = df['job_description'].str.lower().apply(clean_html_and_normalize)
-    df['embedding'] = df['job_description'].apply(lambda x: model.encode(x).tolist())
-    
-    batch_ids = []
-    batch_embeddings = []
-    batch_metadatas = []
-    batch_documents = []
-
-    for i, row in tqdm(df.iterrows(), total=len(df)):
-        try:
-            _id = str(row["uniq_id"])
-            if _id in ids:
-                continue
-
-            embedding = row["embedding"]
-            document = row["job_description"]
-            metadata = row.drop(["uniq_id", "embedding", 'job_description']).to_dict()
-
-            batch_ids.append(_id)
-            batch_embeddings.append(embedding)
-            batch_metadatas.append(metadata)
-            batch_documents.append(document)
-
-            if len(batch_ids) >= batch_size:
-                insert_points_batch(
-                    client=client,
-                    collection_name=collection_name,
-                    ids=batch_ids,
-                    embeddings=batch_embeddings,
-                    metadatas=batch_metadatas,
-                    documents=batch_documents
-                )
-                batch_ids.clear()
-                batch_embeddings.clear()
-                batch_metadatas.clear()
-                batch_documents.clear()
-
-        except Exception as e:
-            print(f"[ERRORE - Riga {i}] {e}")
-            continue
-
-    if batch_ids:
-        insert_points_batch(
-            client=client,
-            collection_name=collection_name,
-            ids=batch_ids,
-            embeddings=batch_embeddings,
-            metadatas=batch_metadatas,
-            documents=batch_documents
-        )
+    if overwrite:
+        invalidate_dedup_index(chroma_db_path, collection_name)
+
+    model = load_encoder(encoder_backend, model_name)
+    cache = EmbeddingCache(embedding_cache_dir, encoder_cache_name(model_name, encoder_backend)) if embedding_cache_dir else None
+    padding_stats = PaddingStats() if length_bucketing else None
+    project = make_projector(projection_path(chroma_db_path), projection_dim) if projection_dim else None
+    dedup = load_dedup_index(client, chroma_db_path, collection_name, dedup_threshold) if dedup_threshold else None
+    dedup_lock = threading.Lock()
+    duplicates = {}  # rappresentante -> membri trovati in questa esecuzione
+    lost_duplicates = 0
+
+    def discard_representatives(ids):
+        """Rappresentanti non scritti: escono dall'indice e i loro membri non vengono registrati."""
+        nonlocal lost_duplicates
+        if dedup is None:
+            return
+        with dedup_lock:
+            dedup.discard(ids)
+            for _id in ids:
+                lost_duplicates += len(duplicates.pop(_id, ()))
+
+    def chunk_label(chunk) -> str:
+        return f"{chunk.index.min()}-{chunk.index.max()}"
+
+    def prepared_chunks():
+        """Legge, deduplica e pulisce i chunk del CSV."""
+        for chunk in timed_iter(iter_job_post_chunks(path, chunk_size=chunk_size), stage_timings, "read", size=len):
+            progress.update(len(chunk))
+            added = []  # nuovi rappresentanti di questo chunk
+            try:
+                chunk["uniq_id"] = chunk["uniq_id"].astype(str)
+                # controlla solo gli id del chunk invece di caricare l'intera collezione
+                with optional_timing(stage_timings, "filter_existing", len(chunk)):
+                    existing = filter_existing_ids(client, collection_name, chunk["uniq_id"])
+                if dedup is not None:
+                    # i membri dei gruppi già registrati non sono punti della collezione ma vanno saltati
+                    existing.update(i for i in chunk["uniq_id"] if dedup.is_member(i))
+                chunk = chunk.drop_duplicates(subset="uniq_id")
+                chunk = chunk.loc[~chunk["uniq_id"].isin(existing)].copy()
+                if chunk.empty:
+                    continue
+                with optional_timing(stage_timings, "clean", len(chunk)):
+                    chunk["job_description"] = clean_html_column(chunk["job_description"], lowercase=True)
+                if dedup is not None:
+                    keep = []
+                    with optional_timing(stage_timings, "dedup", len(chunk)), dedup_lock:
+                        for _id, text in zip(chunk["uniq_id"], chunk["job_description"]):
+                            rep_id = dedup.add(_id, text)
+                            keep.append(rep_id is None)
+                            if rep_id is None:
+                                added.append(_id)
+                            else:
+                                duplicates.setdefault(rep_id, []).append(_id)
+                    chunk = chunk.loc[keep]
+                    if chunk.empty:
+                        continue
+                yield chunk
+            except Exception as e:
+                print(f"[ERRORE - Chunk {chunk_label(chunk)}] {e}")
+                discard_representatives(added)
+
+    def encode_stage(chunks):
+        for chunk in chunks:
+            try:
+                with optional_timing(stage_timings, "encode", len(chunk)):
+                    embeddings = encode_texts(model, chunk["job_description"].tolist(), batch_size=encode_batch_size, cache=cache, length_bucketing=length_bucketing, padding_stats=padding_stats)
+                    if project is not None:
+                        embeddings = project(embeddings)
+                yield chunk, embeddings
+            except ProjectionFitError:
+                raise
+            except Exception as e:
+                print(f"[ERRORE - Chunk {chunk_label(chunk)}] {e}")
+                discard_representatives(chunk["uniq_id"].tolist())
+
+    def write_stage(encoded):
+        for chunk, embeddings in encoded:
+            chunk_ids = chunk["uniq_id"].tolist()
+            done, n_written = 0, 0
+            try:
+                documents = chunk["job_description"].tolist()
+                with optional_timing(stage_timings, "metadata", len(chunk)):
+                    # metadata tipizzati: campi filtrabili normalizzati e stipendio numerico
+                    metadatas = job_post_metadatas(chunk)
+
+                with optional_timing(stage_timings, "write", len(chunk)):
+                    for start in range(0, len(chunk_ids), batch_size):
+                        end = start + batch_size
+                        ok = insert_points_batch(
+                            client=client,
+                            collection_name=collection_name,
+                            ids=chunk_ids[start:end],
+                            embeddings=embeddings[start:end],
+                            metadatas=metadatas[start:end],
+                            documents=documents[start:end]
+                        )
+                        if ok:
+                            n_written += len(chunk_ids[start:end])
+                        else:
+                            discard_representatives(chunk_ids[start:end])
+                        done = end
+                yield n_written
+            except Exception as e:
+                print(f"[ERRORE - Chunk {chunk_label(chunk)}] {e}")
+                discard_representatives(chunk_ids[done:])
+
+    # Lettura/pulizia, encoding e scrittura girano in thread separati collegati da code
+    # di al più pipeline_queue_size chunk: la memoria resta proporzionale a chunk_size
+    # e non alla dimensione del file, e il tempo totale tende a quello dello stage più lento.
+    progress = tqdm(unit="rows")
+    written = 0
+    for n_written in run_pipeline(prepared_chunks(), [encode_stage, write_stage], queue_size=pipeline_queue_size, name="job_posts"):
+        written += n_written
+    progress.close()
+    close_encoder(model)
+
+    if written or overwrite:
+        invalidate_shortlists(chroma_db_path, collection_name)
+        invalidate_lexical_index(chroma_db_path, collection_name)
+    if dedup is not None:
+        # restano solo i gruppi con il rappresentante scritto (ora o in un'esecuzione precedente)
+        if duplicates:
+            record_duplicates(client, collection_name, duplicates)
+            for rep_id, member_ids in duplicates.items():
+                dedup.add_members(rep_id, member_ids)
+            print(f"Quasi duplicati: {sum(len(v) for v in duplicates.values())} job post accorpate in {len(duplicates)} gruppi")
+        if lost_duplicates:
+            print(f"[ATTENZIONE] {lost_duplicates} quasi duplicati non registrati perché il rappresentante non è stato scritto: verranno ripresi alla prossima esecuzione")
+        dedup.save(dedup_index_path(chroma_db_path, collection_name), count=client.get_collection(collection_name).count())
+    if padding_stats is not None:
+        print(f"Token codificati/padding: {padding_stats.as_dict()}")
+
+    if cache is not None:
+        cache.save()
+        print(f"Cache embedding: {cache.stats()}")
 
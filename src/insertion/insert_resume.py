@@ -1,13 +1,26 @@
 import os
+import json
 import hashlib
-import chromadb
+import numpy as np
 
 from typing import Set, List
 from pathlib import Path
 
-from sentence_transformers import SentenceTransformer
-from src.utils.utils_resumes import file_to_plain_text
-from src.utils.utils_chromadb import create_collection, delete_collection, insert_points_batch
+from src.utils.utils_resumes import iter_plain_texts
+from src.utils.utils_chromadb import (
+    create_collection, delete_collection, insert_points_batch, upsert_points_batch,
+    update_metadatas, delete_points, get_existing_ids
+)
+from src.utils.utils_sharding import open_client
+from src.utils.utils_embeddings import encode_texts, PaddingStats
+from src.utils.utils_embedding_cache import EmbeddingCache
+from src.utils.utils_encoders import load_encoder, close_encoder, encoder_cache_name
+from src.utils.utils_pipeline import run_pipeline
+from src.utils.utils_compression import make_projector, projection_path, ProjectionFitError
+from src.utils.utils_timing import StageTimings, optional_timing, timed_iter
+from src.matching.shortlist import invalidate_shortlists
+from src.matching.lexical_index import invalidate_lexical_index
+from src.utils.utils_resume_manifest import load_manifest, load_pending_deletes, save_manifest, plan_resume_sync
 from tqdm import tqdm
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -23,63 +36,274 @@ def get_file_extensions(root: Path) -> Set[str]:
                 extensions[ext] += 1
     return extensions
 
+def write_error_report(errors: List[dict], path: str):
+    """Salva l'elenco dei file non elaborati (path, errore) in JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(errors, f, indent=2, ensure_ascii=False)
+    print(f"{len(errors)} file non elaborati, dettagli in {path}")
+
+def _ingest_files(
+    client,
+    collection_name: str,
+    model,
+    cache,
+    paths: List[str],
+    id_for_path,
+    write_batch,
+    batch_size: int,
+    n_workers: int | None,
+    extraction_chunk_size: int,
+    encode_batch_size: int,
+    encode_pool_size: int,
+    padding_stats: PaddingStats | None = None,
+    queue_size: int = 4,
+    preview_chars: int = 1000,
+    thumbnail_dir: str | None = None,
+    project=None,
+    stage_timings: StageTimings | None = None
+) -> tuple[List[dict], List[str]]:
+    """
+    Estrae, codifica e scrive in Chroma i file indicati.
+    Nei metadata salva, oltre al path, un'anteprima del testo estratto e la miniatura
+    delle immagini, così la UI non deve riaprire i file originali; il testo estratto completo
+    è il documento del punto, da cui si costruisce l'indice BM25 senza riestrarre i file.
+    Estrazione, encoding e scrittura girano in parallelo collegate da code limitate.
+    Restituisce (errori, path scritti con successo).
+    """
+    errors: List[dict] = []
+    written: List[str] = []
+    progress = tqdm(total=len(paths))
+
+    def resume_metadata(path, text, thumbnail):
+        metadata = {
+            "source": path,
+            "file_type": Path(path).suffix.lower().lstrip("."),
+            "preview": text[:preview_chars] + "..." if len(text) > preview_chars else text,
+        }
+        if thumbnail:
+            metadata["thumbnail"] = thumbnail
+        return metadata
+
+    def encode_pool(pool_paths, pool_texts, pool_metadatas):
+        try:
+            with optional_timing(stage_timings, "encode", len(pool_texts)):
+                embeddings = encode_texts(
+                    model, pool_texts, batch_size=encode_batch_size, cache=cache,
+                    length_bucketing=padding_stats is not None, padding_stats=padding_stats
+                )
+                if project is not None:
+                    embeddings = project(embeddings)
+        except ProjectionFitError:
+            raise
+        except Exception as e:
+            errors.extend({"path": p, "stage": "encoding", "error": str(e)} for p in pool_paths)
+            return
+        yield pool_paths, pool_texts, pool_metadatas, embeddings
+
+    def encode_stage(results):
+        # si accumulano più batch prima di codificare, così i batch sono formati per lunghezza
+        pool_paths, pool_texts, pool_metadatas = [], [], []
+        # extract_wait: attesa dei risultati dei worker di estrazione (lo stage a monte)
+        for path, text, error, thumbnail in timed_iter(results, stage_timings, "extract_wait"):
+            progress.update(1)
+            if error is not None:
+                errors.append({"path": path, "stage": "extraction", "error": error})
+                continue
+            pool_paths.append(path)
+            pool_texts.append(text)
+            pool_metadatas.append(resume_metadata(path, text, thumbnail))
+            if len(pool_texts) >= encode_pool_size:
+                yield from encode_pool(pool_paths, pool_texts, pool_metadatas)
+                pool_paths, pool_texts, pool_metadatas = [], [], []
+        if pool_texts:
+            yield from encode_pool(pool_paths, pool_texts, pool_metadatas)
+
+    def write(batch_paths, batch_texts, batch_metadatas, batch_rows):
+        with optional_timing(stage_timings, "write", len(batch_paths)):
+            ok = write_batch(
+                client=client,
+                collection_name=collection_name,
+                ids=[id_for_path(p) for p in batch_paths],
+                embeddings=np.vstack(batch_rows),
+                metadatas=batch_metadatas,
+                documents=batch_texts
+            )
+        if not ok:
+            errors.extend({"path": p, "stage": "write", "error": "scrittura batch non riuscita"} for p in batch_paths)
+            return []
+        return batch_paths
+
+    def write_stage(encoded):
+        batch_paths, batch_texts, batch_metadatas, batch_rows = [], [], [], []
+        for pool_paths, pool_texts, pool_metadatas, embeddings in encoded:
+            batch_paths.extend(pool_paths)
+            batch_texts.extend(pool_texts)
+            batch_metadatas.extend(pool_metadatas)
+            batch_rows.extend(embeddings)
+            while len(batch_paths) >= batch_size:
+                yield write(batch_paths[:batch_size], batch_texts[:batch_size], batch_metadatas[:batch_size], batch_rows[:batch_size])
+                del batch_paths[:batch_size], batch_texts[:batch_size], batch_metadatas[:batch_size], batch_rows[:batch_size]
+        if batch_paths:
+            yield write(batch_paths, batch_texts, batch_metadatas, batch_rows)
+
+    # i testi estratti alimentano il batch di encoding man mano che i worker li completano
+    results = iter_plain_texts(paths, n_workers=n_workers, chunk_size=extraction_chunk_size, thumbnail_dir=thumbnail_dir)
+    for batch_paths in run_pipeline(results, [encode_stage, write_stage], queue_size=queue_size, name="resumes"):
+        written.extend(batch_paths)
+    progress.close()
+    return errors, written
+
+def _path_id(path: str) -> str:
+    return hashlib.md5(str(path).encode()).hexdigest()
+
 def process_resumes_to_chroma(
     root_dir: Path,
     collection_name: str,
     model_name: str = "all-mpnet-base-v2",
     batch_size: int = 1000,
-    overwrite: bool = False
-):
-    client = chromadb.PersistentClient(path="./chroma_db")
+    overwrite: bool = False,
+    embedding_cache_dir: str | None = "./embedding_cache",
+    n_workers: int | None = None,
+    extraction_chunk_size: int = 8,
+    encode_batch_size: int = 64,
+    encode_pool_size: int = 512,
+    pipeline_queue_size: int = 4,
+    preview_chars: int = 1000,
+    thumbnail_dir: str | None = "./resume_thumbnails",
+    error_report_path: str | None = "./resume_errors.json",
+    incremental: bool = False,
+    manifest_path: str | None = None,
+    encoder_backend: str = "sentence_transformers",
+    projection_dim: int | None = None,
+    chroma_db_path: str = "./chroma_db",
+    stage_timings: StageTimings | None = None,
+    n_shards: int | None = None,
+    length_bucketing: bool = False
+) -> List[dict]:
+    """
+    Indicizza i curriculum sotto root_dir nella collezione.
+
+    Con incremental=True usa un manifest (path, size, mtime, hash del contenuto) e l'hash
+    del contenuto come id: i file invariati vengono saltati senza leggerli, quelli spostati
+    vengono solo ricollegati, quelli nuovi o modificati vengono (ri)codificati con upsert e
+    i vettori dei file rimossi vengono eliminati.
+
+    Con projection_dim gli embedding vengono ridotti con la stessa proiezione PCA delle job post.
+    stage_timings (StageTimings), se passato, raccoglie il tempo di extract_wait, encode e write.
+    Con n_shards > 1 una nuova collezione viene creata in shard, come per le job post.
+    length_bucketing come per le job post.
+    """
+    client = open_client(chroma_db_path, n_shards=n_shards)
+    manifest_path = manifest_path or os.path.join(chroma_db_path, f"{collection_name}_manifest.json")
 
     if overwrite:
         delete_collection(client, collection_name)
+        if os.path.isfile(manifest_path):
+            os.remove(manifest_path)
 
     create_collection(client, collection_name)
-    collection = client.get_collection(collection_name)
-    existing_ids = collection.get(limit=int(1e9))["ids"]
 
-    model = SentenceTransformer(model_name)
+    model = load_encoder(encoder_backend, model_name)
+    cache = EmbeddingCache(embedding_cache_dir, encoder_cache_name(model_name, encoder_backend)) if embedding_cache_dir else None
+    ingest_kwargs = dict(
+        client=client,
+        collection_name=collection_name,
+        model=model,
+        cache=cache,
+        batch_size=batch_size,
+        n_workers=n_workers,
+        extraction_chunk_size=extraction_chunk_size,
+        encode_batch_size=encode_batch_size,
+        encode_pool_size=encode_pool_size,
+        padding_stats=PaddingStats() if length_bucketing else None,
+        queue_size=pipeline_queue_size,
+        preview_chars=preview_chars,
+        thumbnail_dir=thumbnail_dir,
+        stage_timings=stage_timings,
+        project=make_projector(projection_path(chroma_db_path), projection_dim) if projection_dim else None,
+    )
 
-    batch_ids: List[str] = []
-    batch_embeddings: List[List[float]] = []
-    batch_metadatas: List[str] = []
+    if incremental:
+        errors, changed = _sync_resumes(root_dir, manifest_path, ingest_kwargs)
+    else:
+        existing_ids = get_existing_ids(client, collection_name)
+        pending_paths = [
+            str(p) for p in root_dir.rglob("*")
+            if p.is_file() and _path_id(p) not in existing_ids
+        ]
+        errors, written = _ingest_files(paths=pending_paths, id_for_path=_path_id, write_batch=insert_points_batch, **ingest_kwargs)
+        changed = overwrite or bool(written)
+    close_encoder(model)
 
-    for p in tqdm(list(root_dir.rglob("*"))):
-        if p.is_file():
-            try:
-                file_id = hashlib.md5(str(p).encode()).hexdigest()
-                if file_id in existing_ids:
-                    continue
-
-                text = file_to_plain_text(p)
-                embedding = model.encode(text).tolist()
-
-                batch_ids.append(file_id)
-                batch_embeddings.append(embedding)
-                batch_metadatas.append({"source": str(p)})
-
-                if len(batch_ids) >= batch_size:
-                    insert_points_batch(
-                        client=client,
-                        collection_name=collection_name,
-                        ids=batch_ids,
-                        embeddings=batch_embeddings,
-                        metadatas=batch_metadatas
-                    )
-                    batch_ids.clear()
-                    batch_embeddings.clear()
-                    batch_metadatas.clear()
-
-            except Exception as e:
-                print(f"Error on {p}: {e}")
-
-    if batch_ids:
-        insert_points_batch(
-            client=client,
-            collection_name=collection_name,
-            ids=batch_ids,
-            embeddings=batch_embeddings,
-            metadatas=batch_metadatas
-        )
+    # le shortlist job post -> curriculum precalcolate non valgono più
+    if changed:
+        invalidate_shortlists(chroma_db_path, collection_name)
+        invalidate_lexical_index(chroma_db_path, collection_name)
+
+    if ingest_kwargs["padding_stats"] is not None:
+        print(f"Token codificati/padding: {ingest_kwargs['padding_stats'].as_dict()}")
+    if cache is not None:
+        cache.save()
+        print(f"Cache embedding: {cache.stats()}")
+    if errors and error_report_path:
+        write_error_report(errors, error_report_path)
+    return errors
+
+def _sync_resumes(root_dir: Path, manifest_path: str, ingest_kwargs: dict) -> tuple[List[dict], bool]:
+    client = ingest_kwargs["client"]
+    collection_name = ingest_kwargs["collection_name"]
+
+    manifest = load_manifest(manifest_path)
+    pending_deletes = load_pending_deletes(manifest_path)
+    plan = plan_resume_sync(root_dir, manifest)
+    print(
+        f"Sync curriculum: {len(plan['unchanged'])} invariati, {len(plan['to_embed'])} da codificare, "
+        f"{len(plan['relinked'])} spostati/copiati, {len(plan['removed'])} rimossi"
+    )
+
+    to_embed = plan["to_embed"]
+    errors, written = _ingest_files(
+        paths=list(to_embed),
+        id_for_path=lambda path: to_embed[path]["hash"],
+        write_batch=upsert_points_batch,
+        **ingest_kwargs
+    )
+    written_hashes = {to_embed[path]["hash"] for path in written}
+
+    files = dict(plan["unchanged"])
+    files.update({path: to_embed[path] for path in written})
+
+    # i contenuti già indicizzati vengono solo ricollegati al nuovo path
+    known_hashes = {entry["hash"] for entry in manifest.values()}
+    relinked = {}
+    for path, entry in plan["relinked"].items():
+        if entry["hash"] in known_hashes or entry["hash"] in written_hashes:
+            relinked[path] = entry
+    moved = {entry["hash"]: path for path, entry in relinked.items() if entry["hash"] in known_hashes}
+    if moved:
+        # anteprima e miniatura restano valide: cambia solo il path
+        current = client.get_collection(collection_name).get(ids=list(moved), include=["metadatas"])
+        metadatas = [dict(meta or {}, source=moved[_id]) for _id, meta in zip(current["ids"], current["metadatas"])]
+        update_metadatas(client, collection_name, ids=current["ids"], metadatas=metadatas)
+    files.update(relinked)
+
+    # file non scritti: resta la voce precedente (e il suo vettore), così vengono ritentati
+    for path in set(to_embed) | set(plan["relinked"]):
+        if path not in files and path in manifest:
+            files[path] = manifest[path]
+
+    # id legacy (md5 del path) lasciati da un'ingestion non incrementale, id non più
+    # referenziati e id la cui eliminazione era fallita nella sync precedente
+    live_hashes = {entry["hash"] for entry in files.values()}
+    stale_ids = [h for h in plan["stale_ids"] if h not in live_hashes]
+    to_delete = [_path_id(path) for path in list(written) + list(relinked)]
+    retried_ids = [i for i in pending_deletes if i not in live_hashes]
+    to_delete += stale_ids + retried_ids
+    if not delete_points(client, collection_name, list(dict.fromkeys(to_delete))):
+        print("Eliminazione non riuscita: verrà ritentata alla prossima sync.")
+        pending_deletes = to_delete
+    else:
+        pending_deletes = []
 
+    save_manifest(manifest_path, files, pending_deletes)
+    return errors, bool(written or stale_ids or retried_ids)
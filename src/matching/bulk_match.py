@@ -0,0 +1,74 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+from src.utils.utils_chromadb import export_collection_embeddings
+from src.utils.utils_sharding import open_client
+from src.utils.utils_similarity import blocked_top_k, normalize_rows
+
+
+def top_k_table(query_ids, corpus_ids, indices, scores, query_col: str, match_col: str) -> pd.DataFrame:
+    """Converte gli indici top-k in una tabella (query, match, rank, score, distance)."""
+    n_queries, k = indices.shape
+    corpus_ids = np.asarray(corpus_ids, dtype=object)
+    return pd.DataFrame({
+        query_col: np.repeat(np.asarray(query_ids, dtype=object), k),
+        match_col: corpus_ids[indices.ravel()],
+        "rank": np.tile(np.arange(1, k + 1), n_queries),
+        "score": scores.ravel(),
+        # distanza L2 al quadrato tra vettori unitari, la stessa scala delle distanze di Chroma
+        "distance": 2.0 - 2.0 * scores.ravel(),
+    })
+
+
+def write_table(df: pd.DataFrame, path: Path):
+    """Scrive in Parquet (serve pyarrow o fastparquet) o CSV in base all'estensione."""
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def run_bulk_matching(
+    chroma_db_path: str = "./chroma_db",
+    job_collection: str = "job_posts",
+    resume_collection: str = "resumes",
+    k: int = 5,
+    output_dir: str = "./matches",
+    output_format: str = "parquet",
+    query_block: int = 1024,
+    corpus_block: int = 65_536,
+    n_threads: int | None = None
+) -> dict:
+    """
+    Calcola in blocco i top-k curriculum per ogni job post e le top-k job post per ogni
+    curriculum, con ricerca esatta a blocchi sugli embedding delle due collezioni.
+    Scrive job_to_resumes e resume_to_jobs in output_dir e restituisce i percorsi.
+    """
+    client = open_client(chroma_db_path)
+    start = time.perf_counter()
+    job_ids, job_embeddings, _ = export_collection_embeddings(client, job_collection)
+    resume_ids, resume_embeddings, _ = export_collection_embeddings(client, resume_collection)
+    print(f"Caricati {len(job_ids)} job post e {len(resume_ids)} curriculum in {time.perf_counter() - start:.1f}s")
+
+    job_embeddings = normalize_rows(job_embeddings)
+    resume_embeddings = normalize_rows(resume_embeddings)
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {}
+    for name, query_ids, queries, corpus_ids, corpus, query_col, match_col in [
+        ("job_to_resumes", job_ids, job_embeddings, resume_ids, resume_embeddings, "job_id", "resume_id"),
+        ("resume_to_jobs", resume_ids, resume_embeddings, job_ids, job_embeddings, "resume_id", "job_id"),
+    ]:
+        start = time.perf_counter()
+        indices, scores = blocked_top_k(
+            queries, corpus, k=k, query_block=query_block, corpus_block=corpus_block,
+            n_threads=n_threads, normalized=True
+        )
+        path = Path(output_dir) / f"{name}.{output_format}"
+        write_table(top_k_table(query_ids, corpus_ids, indices, scores, query_col, match_col), path)
+        print(f"{name}: {len(query_ids)} query, top-{indices.shape[1]} in {time.perf_counter() - start:.1f}s -> {path}")
+        outputs[name] = path
+    return outputs
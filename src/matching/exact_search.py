@@ -0,0 +1,218 @@
+import os
+import time
+import shutil
+import numpy as np
+
+from pathlib import Path
+from src.utils.utils_similarity import blocked_top_k, normalize_rows
+from src.utils.utils_compression import quantize_int8, compression_recall_report, PCAProjection
+
+
+def vector_store_path(chroma_db_path: str, collection_name: str) -> Path:
+    """Cartella con ids.npy e vectors.npy della collezione, accanto al database Chroma."""
+    return Path(chroma_db_path) / "vectors" / collection_name
+
+
+def export_collection_to_npy(client, collection_name: str, output_dir, page_size: int = 5_000) -> Path:
+    """
+    Esporta id ed embedding normalizzati della collezione in output_dir/ids.npy e
+    output_dir/vectors.npy (float32 (n, dim)). I vettori vengono scritti pagina per pagina
+    in un memmap, quindi la collezione non deve stare tutta in memoria.
+    """
+    collection = client.get_collection(collection_name)
+    total = collection.count()
+    output_dir = Path(output_dir)
+    tmp_dir = output_dir.with_name(output_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    ids, vectors, offset = [], None, 0
+    while offset < total:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if len(page["ids"]) == 0:
+            break
+        block = normalize_rows(page["embeddings"])
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(tmp_dir / "vectors.npy", mode="w+", dtype=np.float32, shape=(total, block.shape[1]))
+        vectors[offset:offset + len(block)] = block
+        ids.extend(page["ids"])
+        offset += len(block)
+    if vectors is None:
+        np.save(tmp_dir / "vectors.npy", np.empty((0, 0), dtype=np.float32))
+    else:
+        vectors.flush()
+        del vectors
+    if len(ids) != total:
+        raise RuntimeError(f"Export di '{collection_name}' incompleto: {len(ids)} vettori letti su {total}")
+    np.save(tmp_dir / "ids.npy", np.asarray(ids, dtype=str))
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    print(f"Esportati {len(ids)} vettori di '{collection_name}' in {output_dir}")
+    return output_dir
+
+
+def quantize_vector_store(directory, block_size: int = 65_536) -> Path:
+    """
+    Scrive accanto a vectors.npy la versione int8 (vectors_int8.npy, un quarto dello spazio)
+    con la scala per dimensione in scale.npy, leggendo il float32 a blocchi dal memmap.
+    """
+    directory = Path(directory)
+    vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+    max_abs = np.zeros(vectors.shape[1], dtype=np.float32)
+    for start in range(0, len(vectors), block_size):
+        max_abs = np.maximum(max_abs, np.abs(vectors[start:start + block_size]).max(axis=0))
+    scale = np.maximum(max_abs, 1e-12) / 127.0
+    quantized = np.lib.format.open_memmap(directory / "vectors_int8.tmp.npy", mode="w+", dtype=np.int8, shape=vectors.shape)
+    for start in range(0, len(vectors), block_size):
+        quantized[start:start + block_size], _ = quantize_int8(vectors[start:start + block_size], scale)
+    quantized.flush()
+    del quantized
+    np.save(directory / "scale.npy", scale.astype(np.float32))
+    os.replace(directory / "vectors_int8.tmp.npy", directory / "vectors_int8.npy")
+    return directory / "vectors_int8.npy"
+
+
+class ExactSearchIndex:
+    """
+    Ricerca esatta top-k sui vettori esportati da export_collection_to_npy, letti in memmap.
+    Le distanze sono L2 al quadrato tra vettori unitari (2 - 2 * coseno), la stessa scala di Chroma.
+    Con la versione int8 (quantize_vector_store) la scala viene applicata alle query, quindi
+    il corpus resta int8 su disco e in memoria.
+    """
+
+    def __init__(self, ids, vectors, scale: np.ndarray | None = None):
+        self.ids = ids
+        self.vectors = vectors
+        self.scale = scale
+
+    @classmethod
+    def load(cls, directory, int8: bool = False):
+        """Apre l'export (o la sua versione int8) in sola lettura, None se non esiste."""
+        directory = Path(directory)
+        name = "vectors_int8.npy" if int8 else "vectors.npy"
+        if not (directory / name).is_file():
+            return None
+        scale = np.load(directory / "scale.npy") if int8 else None
+        return cls(np.load(directory / "ids.npy"), np.load(directory / name, mmap_mode="r"), scale)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_valid(self, count: int) -> bool:
+        """L'export è valido solo se la collezione non è cambiata di dimensione."""
+        return count == len(self.ids)
+
+    def search(self, query_embeddings, k: int = 5, query_block: int = 1024, corpus_block: int = 65_536, n_threads: int | None = None):
+        """
+        Top-k esatto per ogni query. Restituisce (ids, distanze) come liste di liste,
+        nello stesso ordine di una query Chroma (dal più vicino).
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if self.scale is not None:
+            queries = queries * self.scale
+        indices, scores = blocked_top_k(
+            queries, self.vectors, k=k, query_block=query_block,
+            corpus_block=corpus_block, n_threads=n_threads, normalized=True
+        )
+        return self.ids[indices].tolist(), (2.0 - 2.0 * scores).tolist()
+
+
+def recall_at_k(collection, index: ExactSearchIndex, query_embeddings, k: int = 10) -> dict:
+    """
+    Confronta i top-k di Chroma (HNSW) con quelli esatti dell'indice: recall@k è la frazione
+    media dei veri k vicini restituita da Chroma. Riporta anche la latenza media per query.
+    """
+    query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+    start = time.perf_counter()
+    approx_ids = [
+        collection.query(query_embeddings=[q.tolist()], n_results=k, include=[])["ids"][0]
+        for q in query_embeddings
+    ]
+    chroma_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    exact_ids, _ = index.search(query_embeddings, k=k)
+    exact_seconds = time.perf_counter() - start
+
+    per_query = [len(set(a) & set(e)) / len(e) for a, e in zip(approx_ids, exact_ids) if e]
+    n_queries = max(len(query_embeddings), 1)
+    return {
+        "k": k,
+        "n_queries": len(query_embeddings),
+        "recall": float(np.mean(per_query)) if per_query else float("nan"),
+        "min_recall": float(np.min(per_query)) if per_query else float("nan"),
+        "chroma_ms_per_query": 1000 * chroma_seconds / n_queries,
+        "exact_ms_per_query": 1000 * exact_seconds / n_queries,
+    }
+
+
+def run_recall_check(
+    chroma_db_path: str = "./chroma_db",
+    collection_name: str = "resumes",
+    query_collection: str = "job_posts",
+    n_queries: int = 200,
+    k: int = 10,
+    seed: int = 0,
+    refresh_export: bool = False
+) -> dict:
+    """
+    Esporta (se manca o non è aggiornato) collection_name e misura la recall@k di Chroma
+    usando come query n_queries embedding campionati da query_collection.
+    """
+    from src.utils.utils_sharding import open_client
+
+    client = open_client(chroma_db_path)
+    collection = client.get_collection(collection_name)
+    directory = vector_store_path(chroma_db_path, collection_name)
+    index = None if refresh_export else ExactSearchIndex.load(directory)
+    if index is None or not index.is_valid(collection.count()):
+        export_collection_to_npy(client, collection_name, directory)
+        index = ExactSearchIndex.load(directory)
+
+    source = client.get_collection(query_collection)
+    rng = np.random.default_rng(seed)
+    offsets = rng.choice(source.count(), size=min(n_queries, source.count()), replace=False)
+    queries = [source.get(include=["embeddings"], limit=1, offset=int(offset))["embeddings"][0] for offset in offsets]
+    report = recall_at_k(collection, index, queries, k=k)
+    print(f"Recall@{k} di '{collection_name}' su {report['n_queries']} query da '{query_collection}': {report}")
+    return report
+
+
+def run_compression_report(
+    chroma_db_path: str = "./chroma_db",
+    collection_name: str = "resumes",
+    query_collection: str = "job_posts",
+    dims=(256, 384),
+    n_queries: int = 200,
+    k: int = 10,
+    fit_sample: int = 20_000,
+    seed: int = 0
+) -> list[dict]:
+    """
+    Recall@k della proiezione PCA (per ogni dimensione in dims) e dell'int8 rispetto alla ricerca
+    esatta sui vettori completi di collection_name. Va eseguito su collezioni indicizzate senza
+    proiezione: serve a scegliere projection_dim prima di reindicizzare.
+    """
+    from src.utils.utils_sharding import open_client
+
+    client = open_client(chroma_db_path)
+    directory = vector_store_path(chroma_db_path, collection_name)
+    index = ExactSearchIndex.load(directory)
+    if index is None or not index.is_valid(client.get_collection(collection_name).count()):
+        export_collection_to_npy(client, collection_name, directory)
+        index = ExactSearchIndex.load(directory)
+
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(index), size=min(fit_sample, len(index)), replace=False))
+    source = client.get_collection(query_collection)
+    offsets = rng.choice(source.count(), size=min(n_queries, source.count()), replace=False)
+    queries = [source.get(include=["embeddings"], limit=1, offset=int(offset))["embeddings"][0] for offset in offsets]
+
+    vectors = np.asarray(index.vectors)
+    reports = []
+    for i, dim in enumerate(dims):
+        projection = PCAProjection.fit(vectors[sample], dim)
+        report = compression_recall_report(vectors, queries, k=k, projection=projection, int8=(i == 0))
+        print(f"Compressione di '{collection_name}': {report}")
+        reports.append(report)
+    return reports
@@ -0,0 +1,211 @@
+import os
+import time
+import numpy as np
+
+from pathlib import Path
+
+# spaCy e sklearn (tramite utils_job_posts) e le librerie di estrazione (PIL, pytesseract,
+# python-docx tramite utils_resumes) vengono importati solo per costruire l'indice o
+# analizzare una query, così l'import del modulo non rallenta l'avvio della UI
+
+
+def lexical_index_path(chroma_db_path: str, collection_name: str) -> Path:
+    """File dell'indice lessicale, salvato accanto al database Chroma."""
+    return Path(chroma_db_path) / "lexical" / f"{collection_name}.npz"
+
+
+def lexical_tokens_path(chroma_db_path: str, collection_name: str) -> Path:
+    """
+    Cache dei lemmi dei documenti (hash del testo -> lemmi) usata per ricostruire l'indice:
+    non viene eliminata con l'indice, così si rilemmatizzano solo i documenti nuovi o modificati.
+    """
+    return Path(chroma_db_path) / "lexical" / f"{collection_name}_tokens.pkl"
+
+
+def invalidate_lexical_index(chroma_db_path: str, collection_name: str):
+    """Elimina l'indice lessicale di collection_name (da chiamare quando la collezione cambia)."""
+    path = lexical_index_path(chroma_db_path, collection_name)
+    if path.is_file():
+        path.unlink()
+        print(f"Indice lessicale invalidato: {path}")
+
+
+def iter_collection_texts(collection, use_sources: bool = False, page_size: int = 1000, n_workers: int | None = None):
+    """
+    Genera coppie (id, testo) di una collezione Chroma dai documenti salvati (per i curriculum
+    il testo estratto in ingestione). Con use_sources i punti senza documento (curriculum
+    indicizzati prima che il testo venisse salvato) vengono riestratti dal file in
+    metadata['source']; se l'estrazione fallisce si usa l'anteprima salvata in ingestione.
+    """
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        offset += len(page["ids"])
+        by_source = {}
+        for _id, doc, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+            meta = meta or {}
+            if doc or not use_sources or not meta.get("source"):
+                yield _id, doc or ""
+            else:
+                by_source[meta["source"]] = (_id, meta)
+        if by_source:
+            from src.utils.utils_resumes import iter_plain_texts
+
+            for path, text, error, _ in iter_plain_texts(list(by_source), n_workers=n_workers):
+                _id, meta = by_source[path]
+                yield _id, text if error is None else meta.get("preview", "")
+
+
+class LexicalIndex:
+    """
+    Indice invertito BM25 su una collezione: per ogni termine del vocabolario la lista dei
+    documenti che lo contengono con il relativo peso. Una query tocca solo le posting list
+    dei suoi termini, quindi il costo dipende dai termini e non dalla dimensione della collezione.
+    """
+
+    def __init__(self, ids, terms, indptr, indices, data, write_stamp: str | None = None):
+        self.ids = ids
+        self.terms = terms
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.write_stamp = write_stamp  # contrassegno di scrittura della collezione al momento della build
+        self._vocabulary = {term: row for row, term in enumerate(terms)}
+        self._analyzer = None
+
+    @classmethod
+    def build(cls, ids, texts, k1: float = 1.2, b: float = 0.75, batch_size: int = 256, n_process: int = 1, token_cache: dict | None = None):
+        """Costruisce l'indice con gli stessi lemmi usati da compute_tfidf_features."""
+        from sklearn.feature_extraction.text import CountVectorizer
+        from src.utils.utils_job_posts import LemmaAnalyzer, pretokenize_corpus
+
+        tokens = pretokenize_corpus(texts, batch_size=batch_size, n_process=n_process, cache=token_cache, prune=token_cache is not None)
+        vectorizer = CountVectorizer(analyzer=LemmaAnalyzer(), dtype=np.float32)
+        try:
+            counts = vectorizer.fit_transform(tokens).tocsc()
+        except ValueError:
+            # collezione vuota o senza termini: indice vuoto, la ricerca ricade su quella vettoriale
+            return cls(np.asarray(ids, dtype=str), np.asarray([], dtype=str), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+
+        n_docs = counts.shape[0]
+        doc_len = np.asarray(counts.sum(axis=1)).ravel()
+        norm = k1 * (1 - b + b * doc_len / max(doc_len.mean(), 1e-12))
+        doc_freq = np.diff(counts.indptr)
+        idf = np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        # in CSC le colonne (termini) sono le posting list: indices = documenti, data = tf
+        tf = counts.data
+        rows = counts.indices
+        weights = idf[np.repeat(np.arange(counts.shape[1]), doc_freq)] * tf * (k1 + 1) / (tf + norm[rows])
+        return cls(
+            ids=np.asarray(ids, dtype=str),
+            terms=np.asarray(vectorizer.get_feature_names_out(), dtype=str),
+            indptr=counts.indptr.astype(np.int64),
+            indices=rows.astype(np.int32),
+            data=weights.astype(np.float32),
+        )
+
+    def save(self, path):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        tmp_path = Path(path).with_name(Path(path).stem + ".tmp.npz")
+        np.savez(
+            tmp_path, ids=self.ids, terms=self.terms, indptr=self.indptr, indices=self.indices, data=self.data,
+            write_stamp=np.asarray(self.write_stamp or "", dtype=str)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Carica l'indice, None se il file non esiste."""
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            write_stamp = str(data["write_stamp"]) if "write_stamp" in data.files else ""
+            return cls(data["ids"], data["terms"], data["indptr"], data["indices"], data["data"], write_stamp or None)
+
+    def is_valid(self, count: int) -> bool:
+        """L'indice è valido solo se la collezione non è cambiata di dimensione."""
+        return count == len(self.ids)
+
+    def scores(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Punteggi BM25 per il testo della query: (posizioni dei documenti con almeno un termine
+        in comune, punteggi). Si leggono solo le posting list dei termini della query.
+        """
+        if self._analyzer is None:
+            from src.utils.utils_job_posts import LemmaAnalyzer
+
+            self._analyzer = LemmaAnalyzer()
+        postings, weights = [], []
+        terms, counts = np.unique(self._analyzer(text), return_counts=True)
+        for term, count in zip(terms, counts):
+            row = self._vocabulary.get(term)
+            if row is None:
+                continue
+            start, end = self.indptr[row], self.indptr[row + 1]
+            postings.append(self.indices[start:end])
+            weights.append(count * self.data[start:end])
+        if not postings:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        docs, inverse = np.unique(np.concatenate(postings), return_inverse=True)
+        return docs, np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+
+    def candidates(self, text: str, n: int = 2000) -> list[str]:
+        """Id dei (al più) n documenti con punteggio BM25 più alto, dal migliore; [] se nessun termine è noto."""
+        docs, scores = self.scores(text)
+        if len(docs) > n:
+            keep = np.argpartition(-scores, n - 1)[:n]
+            docs, scores = docs[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        return self.ids[docs[order]].tolist()
+
+
+def build_lexical_indexes(
+    chroma_db_path: str = "./chroma_db",
+    job_collection: str = "job_posts",
+    resume_collection: str = "resumes",
+    n_process: int = 1,
+    n_workers: int | None = None,
+    rebuild: bool = False
+) -> dict:
+    """
+    Costruisce o aggiorna e salva gli indici lessicali di job post e curriculum dai documenti
+    salvati in Chroma, usati dalla ricerca ibrida.
+    Un indice ancora valido e costruito dopo l'ultima scrittura nella collezione viene lasciato
+    com'è (salvo rebuild); altrimenti i lemmi si riusano dalla cache per hash del testo e
+    vengono calcolati solo per i documenti nuovi o modificati.
+    """
+    from src.utils.utils_sharding import open_client
+    from src.utils.utils_chromadb import read_write_stamp
+    from src.utils.utils_job_posts import load_token_cache, save_token_cache
+
+    client = open_client(chroma_db_path)
+    paths = {}
+    for collection_name, use_sources in ((job_collection, False), (resume_collection, True)):
+        start = time.perf_counter()
+        collection = client.get_collection(collection_name)
+        path = lexical_index_path(chroma_db_path, collection_name)
+        paths[collection_name] = path
+        write_stamp = read_write_stamp(chroma_db_path, collection_name)
+        current = None if rebuild else LexicalIndex.load(path)
+        if current is not None and write_stamp is not None and current.write_stamp == write_stamp and current.is_valid(collection.count()):
+            print(f"Indice lessicale di '{collection_name}' già aggiornato: {path}")
+            continue
+
+        ids, texts = [], []
+        for _id, text in iter_collection_texts(collection, use_sources=use_sources, n_workers=n_workers):
+            ids.append(_id)
+            texts.append(text)
+        tokens_path = str(lexical_tokens_path(chroma_db_path, collection_name))
+        token_cache = {} if rebuild else load_token_cache(tokens_path)
+        cached_keys = set(token_cache)
+        index = LexicalIndex.build(ids, texts, n_process=n_process, token_cache=token_cache)
+        index.write_stamp = write_stamp
+        index.save(path)
+        save_token_cache(tokens_path, token_cache)
+        print(
+            f"Indice lessicale di '{collection_name}': {len(ids)} documenti ({len(token_cache.keys() - cached_keys)} lemmatizzati ex novo), "
+            f"{len(index.terms)} termini in {time.perf_counter() - start:.1f}s -> {path}"
+        )
+    return paths
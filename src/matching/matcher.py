@@ -0,0 +1,156 @@
+import numpy as np
+
+
+def shortlisted_resumes(resumes_collection, shortlist, job_post_id: str, n_results: int = 5):
+    """
+    Curriculum in shortlist per la job post, nello stesso formato di una singola query
+    ({'ids', 'documents', 'metadatas', 'distances'}), oppure None se non disponibili.
+    """
+    if shortlist is None:
+        return None
+    hit = shortlist.get(job_post_id, n_results)
+    if hit is None:
+        return None
+    resume_ids, distances = hit
+    found = resumes_collection.get(ids=resume_ids, include=['documents', 'metadatas'])
+    by_id = {_id: (doc, meta) for _id, doc, meta in zip(found['ids'], found['documents'], found['metadatas'])}
+    if len(by_id) != len(resume_ids):
+        return None
+    return {
+        'ids': resume_ids,
+        'documents': [by_id[_id][0] for _id in resume_ids],
+        'metadatas': [by_id[_id][1] for _id in resume_ids],
+        'distances': distances,
+    }
+
+
+def rerank_candidates(collection, candidate_ids: list[str], query_embedding, n_results: int = 5, include=('documents', 'metadatas'), where=None):
+    """
+    Riordina i candidati (es. dall'indice lessicale) per distanza L2 al quadrato esatta
+    dalla query, come farebbe Chroma, e restituisce i primi n_results nel formato di una
+    singola query ({'ids', 'documents', 'metadatas', 'distances', ...}), None se non ci sono candidati.
+    Con where vengono considerati solo i candidati che soddisfano il filtro.
+    """
+    if not candidate_ids:
+        return None
+    found = collection.get(ids=candidate_ids, include=['embeddings', *include], where=where)
+    if not len(found['ids']):
+        return None
+    embeddings = np.asarray(found['embeddings'], dtype=np.float32)
+    distances = ((embeddings - np.asarray(query_embedding, dtype=np.float32)) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind='stable')[:n_results]
+    result = {'ids': [found['ids'][i] for i in order], 'distances': distances[order].tolist()}
+    for key in include:
+        result[key] = [found[key][i] for i in order]
+    return result
+
+
+def _job_post(job_id: str, text: str, metadata: dict | None) -> dict:
+    return {
+        'id': job_id,
+        'text': text,
+        # Usa .get() con un valore di default per gestire il caso in cui 'job_title' non sia presente
+        'title': (metadata or {}).get('job_title', 'Titolo Sconosciuto'),
+    }
+
+
+def find_matches(
+    job_posts_collection,
+    resumes_collection,
+    query_embedding,
+    n_resumes: int = 5,
+    shortlist=None,
+    query_text: str | None = None,
+    job_index=None,
+    resume_index=None,
+    n_candidates: int = 2000,
+    where=None
+):
+    """
+    Trova la job post più simile alla query e i n_resumes curriculum più vicini a quella job post.
+    Se è disponibile una shortlist valida i curriculum vengono letti da lì invece di
+    rifare la query vettoriale. Restituisce None se non c'è nessuna job post.
+
+    Ricerca ibrida: con job_index/resume_index (LexicalIndex) e query_text, gli n_candidates
+    documenti migliori per BM25 vengono riordinati con le distanze esatte degli embedding;
+    se l'indice lessicale non trova candidati si usa la query vettoriale di Chroma.
+
+    where (es. da build_where) filtra le job post per metadata prima della ricerca.
+    """
+    job_fields = ('documents', 'metadatas', 'embeddings')
+    best_job = None
+    if job_index is not None and query_text:
+        best_job = rerank_candidates(job_posts_collection, job_index.candidates(query_text, n_candidates), query_embedding, 1, include=job_fields, where=where)
+    if best_job is None:
+        similar_job_posts = job_posts_collection.query(
+            query_embeddings=[query_embedding],
+            n_results=1,
+            include=list(job_fields),
+            where=where
+        )
+        if not similar_job_posts['documents'] or not similar_job_posts['documents'][0]:
+            return None
+        best_job = {key: similar_job_posts[key][0] for key in ('ids', *job_fields)}
+
+    job_post = _job_post(best_job['ids'][0], best_job['documents'][0], best_job['metadatas'][0])
+    job_embedding = best_job['embeddings'][0]
+
+    # Prima la shortlist precalcolata (lookup per id), poi i candidati lessicali, altrimenti la query vettoriale
+    resumes = shortlisted_resumes(resumes_collection, shortlist, job_post['id'], n_resumes)
+    if resumes is None and resume_index is not None:
+        resumes = rerank_candidates(resumes_collection, resume_index.candidates(job_post['text'], n_candidates), job_embedding, n_resumes)
+    if resumes is None:
+        # ChromaDB restituisce i risultati già ordinati per distanza (dal più vicino al più lontano)
+        similar_resumes = resumes_collection.query(
+            query_embeddings=[job_embedding],
+            n_results=n_resumes,
+            include=['documents', 'metadatas', 'distances']
+        )
+        resumes = {key: similar_resumes[key][0] if similar_resumes[key] else [] for key in ('ids', 'documents', 'metadatas', 'distances')}
+    return {'job_post': job_post, 'resumes': resumes}
+
+
+def find_matches_batch(
+    job_posts_collection,
+    resumes_collection,
+    query_embeddings,
+    n_resumes: int = 5,
+    shortlist=None,
+    where=None
+) -> list:
+    """
+    Come find_matches (ricerca vettoriale) per più query insieme: una sola query Chroma con tutti
+    gli embedding per le job post e una sola per i curriculum delle job post fuori dalla shortlist.
+    Restituisce un risultato per query, nello stesso ordine (None se non c'è nessuna job post).
+    """
+    if len(query_embeddings) == 0:
+        return []
+    similar_job_posts = job_posts_collection.query(
+        query_embeddings=[list(map(float, q)) for q in query_embeddings],
+        n_results=1,
+        include=['documents', 'metadatas', 'embeddings'],
+        where=where
+    )
+    results = [None] * len(query_embeddings)
+    job_embeddings = {}
+    for i in range(len(query_embeddings)):
+        if i >= len(similar_job_posts['ids']) or not similar_job_posts['ids'][i]:
+            continue
+        job_post = _job_post(similar_job_posts['ids'][i][0], similar_job_posts['documents'][i][0], similar_job_posts['metadatas'][i][0])
+        results[i] = {'job_post': job_post, 'resumes': shortlisted_resumes(resumes_collection, shortlist, job_post['id'], n_resumes)}
+        if results[i]['resumes'] is None:
+            job_embeddings[i] = similar_job_posts['embeddings'][i][0]
+
+    if job_embeddings:
+        positions = list(job_embeddings)
+        similar_resumes = resumes_collection.query(
+            query_embeddings=[list(map(float, job_embeddings[i])) for i in positions],
+            n_results=n_resumes,
+            include=['documents', 'metadatas', 'distances']
+        )
+        for row, i in enumerate(positions):
+            results[i]['resumes'] = {
+                key: similar_resumes[key][row] if row < len(similar_resumes[key]) else []
+                for key in ('ids', 'documents', 'metadatas', 'distances')
+            }
+    return results
@@ -0,0 +1,100 @@
+import os
+import time
+import numpy as np
+
+from pathlib import Path
+from src.utils.utils_chromadb import export_collection_embeddings
+from src.utils.utils_similarity import blocked_top_k, normalize_rows
+
+
+def shortlist_path(chroma_db_path: str, job_collection: str, resume_collection: str) -> Path:
+    """File della shortlist, salvato accanto al database Chroma."""
+    return Path(chroma_db_path) / "shortlists" / f"{job_collection}__{resume_collection}.npz"
+
+
+def invalidate_shortlists(chroma_db_path: str, collection_name: str):
+    """Elimina le shortlist che coinvolgono collection_name (da chiamare quando la collezione cambia)."""
+    directory = Path(chroma_db_path) / "shortlists"
+    if not directory.is_dir():
+        return
+    for path in directory.glob("*.npz"):
+        if collection_name in path.stem.split("__"):
+            path.unlink()
+            print(f"Shortlist invalidata: {path}")
+
+
+def build_resume_shortlists(
+    chroma_db_path: str = "./chroma_db",
+    job_collection: str = "job_posts",
+    resume_collection: str = "resumes",
+    top_n: int = 20,
+    query_block: int = 1024,
+    n_threads: int | None = None
+) -> Path:
+    """
+    Calcola per ogni job post i top_n curriculum più vicini (distanza L2 al quadrato, come Chroma)
+    e li salva in un .npz accanto alla collezione, insieme al numero di curriculum usati
+    per riconoscere una shortlist non più valida.
+    """
+    from src.utils.utils_sharding import open_client
+
+    client = open_client(chroma_db_path)
+    start = time.perf_counter()
+    job_ids, job_embeddings, _ = export_collection_embeddings(client, job_collection)
+    resume_ids, resume_embeddings, _ = export_collection_embeddings(client, resume_collection)
+    indices, scores = blocked_top_k(
+        normalize_rows(job_embeddings), normalize_rows(resume_embeddings), k=top_n,
+        query_block=query_block, n_threads=n_threads, normalized=True
+    )
+
+    path = shortlist_path(chroma_db_path, job_collection, resume_collection)
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.stem + ".tmp.npz")
+    np.savez(
+        tmp_path,
+        job_ids=np.asarray(job_ids, dtype=str),
+        resume_ids=np.asarray(resume_ids, dtype=str),
+        indices=indices.astype(np.int32),
+        distances=(2.0 - 2.0 * scores).astype(np.float32),
+        resume_count=np.int64(len(resume_ids)),
+    )
+    os.replace(tmp_path, path)
+    print(f"Shortlist di {indices.shape[1]} curriculum per {len(job_ids)} job post in {time.perf_counter() - start:.1f}s -> {path}")
+    return path
+
+
+class ResumeShortlist:
+    """Shortlist precalcolata job post -> curriculum, consultabile per id in O(1)."""
+
+    def __init__(self, job_ids, resume_ids, indices, distances, resume_count: int):
+        self.resume_ids = resume_ids
+        self.indices = indices
+        self.distances = distances
+        self.resume_count = resume_count
+        self._rows = {job_id: row for row, job_id in enumerate(job_ids)}
+
+    @classmethod
+    def load(cls, path):
+        """Carica la shortlist, None se il file non esiste."""
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            return cls(
+                job_ids=data["job_ids"].tolist(),
+                resume_ids=data["resume_ids"],
+                indices=data["indices"],
+                distances=data["distances"],
+                resume_count=int(data["resume_count"]),
+            )
+
+    def is_valid(self, resume_count: int) -> bool:
+        """La shortlist è valida solo se la collezione dei curriculum non è cambiata di dimensione."""
+        return resume_count == self.resume_count
+
+    def get(self, job_id: str, n: int = 5):
+        """Restituisce (id curriculum, distanze) dei primi n, None se la job post non è in shortlist."""
+        row = self._rows.get(job_id)
+        if row is None or n > self.indices.shape[1]:
+            return None
+        idx = self.indices[row, :n]
+        return self.resume_ids[idx].tolist(), self.distances[row, :n].tolist()
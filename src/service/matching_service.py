@@ -0,0 +1,362 @@
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.utils.utils_metrics import METRICS, log_event
+
+METRICS.describe("service_requests_total", "Richieste HTTP del servizio di matching per esito")
+METRICS.describe("service_request_seconds", "Durata delle richieste /match (coda + batch)")
+METRICS.describe("service_queue_wait_seconds", "Attesa in coda prima dell'inizio del batch")
+METRICS.describe("service_batch_seconds", "Durata di un batch (encode + ricerca)")
+METRICS.describe("service_batches_total", "Batch eseguiti")
+METRICS.describe("service_batched_requests_total", "Richieste eseguite nei batch (diviso batch = dimensione media)")
+
+SEARCH_MODES = ("dense", "hybrid")
+
+
+class ServiceError(Exception):
+    """Errore con codice HTTP, restituito al client come {"error": ...}."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class MatchRequest:
+    def __init__(self, description: str, n_resumes: int, search_mode: str, where: dict | None, future: asyncio.Future):
+        self.description = description
+        self.n_resumes = n_resumes
+        self.search_mode = search_mode
+        self.where = where
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Raccoglie le richieste concorrenti e le passa a process_batch a gruppi: un batch parte quando
+    ha max_batch_size richieste o quando la prima ha atteso max_wait_ms. process_batch gira in un
+    solo thread dedicato (il modello non viene usato in parallelo); mentre un batch è in corso le
+    nuove richieste si accumulano per il successivo, quindi sotto carico i batch crescono da soli.
+    """
+
+    def __init__(self, process_batch, max_batch_size: int = 32, max_wait_ms: float = 5.0, max_queue: int = 1024):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="match-batch")
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    def submit(self, request: MatchRequest):
+        """Accoda la richiesta; con la coda piena solleva ServiceError 503 invece di accumulare ritardo."""
+        try:
+            self.queue.put_nowait(request)
+        except asyncio.QueueFull:
+            raise ServiceError(503, "Servizio sovraccarico, riprova più tardi")
+
+    async def _collect(self) -> list[MatchRequest]:
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # le richieste già scadute (timeout del client) non vengono calcolate
+        return [r for r in batch if not r.future.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            for request in batch:
+                METRICS.observe("service_queue_wait_seconds", start - request.enqueued)
+            try:
+                results = await loop.run_in_executor(self._executor, self.process_batch, batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            METRICS.observe("service_batch_seconds", time.perf_counter() - start)
+            METRICS.inc("service_batches_total")
+            METRICS.inc("service_batched_requests_total", len(batch))
+            for request, result in zip(batch, results):
+                if request.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+
+
+class MatchingService:
+    """
+    Servizio di matching locale: stessa logica di main.py (job post più simile, poi curriculum
+    dalla shortlist o dalla query vettoriale, ricerca ibrida con gli indici BM25), ma le richieste
+    concorrenti vengono codificate in un solo forward pass e cercate con una query Chroma multi-embedding.
+    """
+
+    def __init__(
+        self,
+        chroma_db_path: str = "./chroma_db",
+        model_name: str = "all-mpnet-base-v2",
+        encoder_backend: str = "sentence_transformers",
+        job_collection: str = "job_posts",
+        resume_collection: str = "resumes",
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        request_timeout: float = 10.0,
+        max_queue: int = 1024,
+        max_resumes: int = 50,
+        max_body_bytes: int = 64 * 1024
+    ):
+        self.chroma_db_path = chroma_db_path
+        self.model_name = model_name
+        self.encoder_backend = encoder_backend
+        self.job_collection = job_collection
+        self.resume_collection = resume_collection
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.request_timeout = request_timeout
+        self.max_queue = max_queue
+        self.max_resumes = max_resumes
+        self.max_body_bytes = max_body_bytes
+        self.batcher = None
+
+    def load(self):
+        """Carica modello (con warm-up), collezioni, proiezione, shortlist e indici lessicali."""
+        from src.utils.utils_encoders import load_encoder
+        from src.utils.utils_sharding import open_client
+        from src.utils.utils_compression import PCAProjection, projection_path
+        from src.matching.shortlist import ResumeShortlist, shortlist_path
+        from src.matching.lexical_index import LexicalIndex, lexical_index_path
+
+        start = time.perf_counter()
+        self.model = load_encoder(self.encoder_backend, self.model_name)
+        self.model.encode(["warm up"])
+        client = open_client(self.chroma_db_path)
+        self.job_posts = client.get_collection(self.job_collection)
+        self.resumes = client.get_collection(self.resume_collection)
+        self.projection = PCAProjection.load(projection_path(self.chroma_db_path))
+        self.shortlist = ResumeShortlist.load(shortlist_path(self.chroma_db_path, self.job_collection, self.resume_collection))
+        self.job_index = LexicalIndex.load(lexical_index_path(self.chroma_db_path, self.job_collection))
+        self.resume_index = LexicalIndex.load(lexical_index_path(self.chroma_db_path, self.resume_collection))
+        print(f"Servizio di matching pronto in {time.perf_counter() - start:.1f}s "
+              f"({self.job_posts.count()} job post, {self.resumes.count()} curriculum)")
+
+    def _valid_shortlist(self):
+        if self.shortlist is None or not self.shortlist.is_valid(self.resumes.count()):
+            return None
+        return self.shortlist
+
+    def _valid_index(self, index, collection):
+        if index is None or not index.is_valid(collection.count()):
+            return None
+        return index
+
+    def match_batch(self, requests: list[MatchRequest]) -> list:
+        """
+        Un forward pass per tutte le descrizioni, poi una query Chroma per ogni gruppo di richieste
+        con gli stessi parametri (n_resumes, filtri); le richieste ibride usano find_matches.
+        Restituisce un risultato (o un'eccezione) per richiesta.
+        """
+        from src.utils.utils_embeddings import encode_texts
+        from src.matching.matcher import find_matches, find_matches_batch
+
+        embeddings = encode_texts(self.model, [r.description for r in requests], batch_size=self.max_batch_size)
+        if self.projection is not None:
+            embeddings = self.projection.transform(embeddings)
+        shortlist = self._valid_shortlist()
+
+        results = [None] * len(requests)
+        groups = {}
+        for i, request in enumerate(requests):
+            key = (request.search_mode, request.n_resumes, json.dumps(request.where, sort_keys=True))
+            groups.setdefault(key, []).append(i)
+        for (search_mode, n_resumes, _), positions in groups.items():
+            where = requests[positions[0]].where
+            try:
+                if search_mode == "hybrid":
+                    job_index = self._valid_index(self.job_index, self.job_posts)
+                    resume_index = self._valid_index(self.resume_index, self.resumes)
+                    for i in positions:
+                        results[i] = find_matches(
+                            self.job_posts, self.resumes, embeddings[i].tolist(), n_resumes=n_resumes,
+                            shortlist=shortlist, query_text=requests[i].description,
+                            job_index=job_index, resume_index=resume_index, where=where
+                        )
+                else:
+                    group_results = find_matches_batch(
+                        self.job_posts, self.resumes, embeddings[positions], n_resumes=n_resumes, shortlist=shortlist, where=where
+                    )
+                    for i, result in zip(positions, group_results):
+                        results[i] = result
+            except Exception as e:
+                for i in positions:
+                    results[i] = e
+        return results
+
+    def parse_request(self, body: bytes) -> tuple[str, int, str, dict | None]:
+        """Valida il JSON di /match: description, n_resumes, search_mode e filters (come build_where)."""
+        from src.utils.utils_metadata import build_where
+
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise ServiceError(400, "JSON non valido")
+        if not isinstance(payload, dict):
+            raise ServiceError(400, "Il corpo deve essere un oggetto JSON")
+        description = payload.get("description")
+        if not isinstance(description, str) or not description.strip():
+            raise ServiceError(400, "Campo 'description' mancante o vuoto")
+        n_resumes = payload.get("n_resumes", 5)
+        if not isinstance(n_resumes, int) or not 1 <= n_resumes <= self.max_resumes:
+            raise ServiceError(400, f"'n_resumes' deve essere un intero tra 1 e {self.max_resumes}")
+        search_mode = payload.get("search_mode", "dense")
+        if search_mode not in SEARCH_MODES:
+            raise ServiceError(400, f"'search_mode' deve essere uno tra {', '.join(SEARCH_MODES)}")
+        filters = payload.get("filters") or {}
+        if not isinstance(filters, dict):
+            raise ServiceError(400, "'filters' deve essere un oggetto")
+        try:
+            where = build_where(**filters)
+        except (TypeError, ValueError) as e:
+            # campi sconosciuti (TypeError) o stipendi non numerici come "abc" (ValueError)
+            raise ServiceError(400, f"Filtri non validi: {e}")
+        return description, n_resumes, search_mode, where
+
+    async def match(self, body: bytes) -> dict:
+        description, n_resumes, search_mode, where = self.parse_request(body)
+        future = asyncio.get_running_loop().create_future()
+        self.batcher.submit(MatchRequest(description, n_resumes, search_mode, where, future))
+        try:
+            result = await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError:
+            raise ServiceError(504, f"Timeout dopo {self.request_timeout}s")
+        return {"match": result}
+
+    async def route(self, method: str, path: str, body: bytes) -> tuple[int, str, bytes]:
+        """Restituisce (status, content type, corpo) della risposta."""
+        path = path.split("?")[0]
+        if method == "POST" and path == "/match":
+            start = time.perf_counter()
+            try:
+                payload = await self.match(body)
+                status = 200
+            except ServiceError as e:
+                status, payload = e.status, {"error": str(e)}
+            except Exception as e:
+                status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                log_event("service_error", error=payload["error"])
+            seconds = time.perf_counter() - start
+            METRICS.inc("service_requests_total", status=status)
+            METRICS.observe("service_request_seconds", seconds)
+            return status, "application/json", json.dumps(payload, default=_json_default).encode("utf-8")
+        if method == "GET" and path == "/health":
+            body = {"status": "ok", "queued": self.batcher.queue.qsize()}
+            return 200, "application/json", json.dumps(body).encode("utf-8")
+        if method == "GET" and path == "/metrics":
+            return 200, "text/plain; version=0.0.4; charset=utf-8", METRICS.to_prometheus().encode("utf-8")
+        return 404, "application/json", b'{"error": "not found"}'
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, content_type: str, payload: bytes, keep_alive: bool):
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+        )
+        await writer.drain()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """HTTP/1.1 minimale con keep-alive: una richiesta alla volta per connessione."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get("content-length", "0") or "0"
+                length = int(length) if length.isdigit() else -1
+                if not 0 <= length <= self.max_body_bytes:
+                    # corpo non letto: la connessione non è più allineata e va chiusa
+                    status = 413 if length > self.max_body_bytes else 400
+                    error = f"Corpo oltre {self.max_body_bytes} byte" if status == 413 else "Content-Length non valido"
+                    METRICS.inc("service_requests_total", status=status)
+                    await self._respond(writer, status, "application/json", json.dumps({"error": error}).encode("utf-8"), False)
+                    break
+                body = await reader.readexactly(length)
+                status, content_type, payload = await self.route(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, ready: asyncio.Event | None = None):
+        """Avvia batcher e server HTTP e resta in ascolto finché il task non viene cancellato."""
+        self.batcher = MicroBatcher(self.match_batch, self.max_batch_size, self.max_wait_ms, self.max_queue)
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Servizio di matching su http://{host}:{port} (POST /match, GET /health, GET /metrics)")
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def run_service(host: str = "127.0.0.1", port: int = 8765, **kwargs):
+    """Carica il servizio e lo esegue fino a Ctrl+C."""
+    service = MatchingService(**kwargs)
+    service.load()
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        print("Servizio di matching arrestato")
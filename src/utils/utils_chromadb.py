@@ -1,13 +1,63 @@
-import chromadb
+import os
+import time
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from src.utils.utils_metrics import METRICS, log_event
+
+
+def _record_write(op, collection_name, n_points, seconds):
+    METRICS.observe("chroma_write_seconds", seconds, collection=collection_name, op=op)
+    METRICS.inc("chroma_points_written_total", n_points, collection=collection_name, op=op)
+    log_event("chroma_write", op=op, collection=collection_name, points=n_points, seconds=round(seconds, 4))
+
+
+def _record_error(op, collection_name, error):
+    # gli helper non propagano le eccezioni: contatore e log JSON le rendono comunque visibili
+    METRICS.inc("chroma_errors_total", collection=collection_name, op=op)
+    log_event("chroma_error", level=logging.ERROR, op=op, collection=collection_name, error=f"{type(error).__name__}: {error}")
+
+
+def write_stamp_path(chroma_db_path: str, collection_name: str) -> Path:
+    """File con il contrassegno dell'ultima scrittura nella collezione, accanto al database Chroma."""
+    return Path(chroma_db_path) / "write_stamps" / collection_name
+
+
+def bump_write_stamp(client, collection_name: str):
+    """
+    Aggiorna il contrassegno di scrittura della collezione (con un client di open_client).
+    Lo chiamano tutti gli helper che modificano punti o metadata: chi tiene risultati in
+    cache (es. l'app) li considera validi solo finché il contrassegno non cambia.
+    """
+    chroma_db_path = getattr(client, "chroma_db_path", None)
+    if chroma_db_path is None:
+        return
+    path = write_stamp_path(chroma_db_path, collection_name)
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(f"{time.time_ns()}-{os.getpid()}", encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def read_write_stamp(chroma_db_path: str, collection_name: str) -> str | None:
+    """Contrassegno dell'ultima scrittura nella collezione, None se non è mai stata scritta."""
+    try:
+        return write_stamp_path(chroma_db_path, collection_name).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
 
 
 def create_collection(client, name):
     """Crea una collezione con il nome specificato."""
     try:
         collection = client.create_collection(name)
+        bump_write_stamp(client, name)
         print(f"Collezione '{name}' creata.")
         return collection
     except Exception as e:
+        _record_error("create_collection", name, e)
         print(f"Errore creazione collezione: {e}")
         return None
 
@@ -15,9 +65,11 @@ def delete_collection(client, name):
     """Elimina una collezione esistente."""
     try:
         collection = client.delete_collection(name)
+        bump_write_stamp(client, name)
         # collection.delete()
         print(f"Collezione '{name}' eliminata.")
     except Exception as e:
+        _record_error("delete_collection", name, e)
         print(f"Errore eliminazione collezione: {e}")
 
 def insert_point(client, collection_name, id, embedding, metadata=None):
@@ -29,20 +81,33 @@ def insert_point(client, collection_name, id, embedding, metadata=None):
             embeddings=[embedding],
             ids=[id]
         )
+        bump_write_stamp(client, collection_name)
         # print(f"Punto con id '{id}' inserito in '{collection_name}'.")
     except Exception as e:
+        _record_error("add", collection_name, e)
         print(f"Errore inserimento punto: {e}")
 
-def search_point(client, collection_name, query_embedding, n_results=5):
-    """Cerca i punti più simili al vettore query_embedding."""
+def search_point(client, collection_name, query_embedding, n_results=5, where=None, projection=None):
+    """
+    Cerca i punti più simili al vettore query_embedding.
+    where (es. da build_where) restringe la ricerca ai punti con i metadata indicati;
+    projection (PCAProjection) va passata se la collezione è stata indicizzata con projection_dim.
+    Con un client di open_client, una collezione in shard viene interrogata su tutti gli shard
+    in parallelo e i risultati uniti per distanza.
+    """
     try:
         collection = client.get_collection(collection_name)
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
+        if projection is not None:
+            query_embedding = projection.transform(query_embedding).tolist()
+        with METRICS.time("chroma_query_seconds", collection=collection_name):
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where
+            )
         return results
     except Exception as e:
+        _record_error("query", collection_name, e)
         print(f"Errore nella ricerca: {e}")
         return None
 
@@ -52,21 +117,153 @@ def insert_points_batch(client, collection_name, ids, embeddings, metadatas=None
     Inserisce in batch punti nella collezione.
     
     ids: lista di stringhe
-    embeddings: lista di vettori
+    embeddings: lista di vettori o matrice numpy (n, dim)
     metadatas: lista di metadata o None
+    Restituisce True se il batch è stato scritto.
     """
     try:
         collection = client.get_collection(collection_name)
+        if isinstance(embeddings, np.ndarray):
+            embeddings = embeddings.tolist()
         if metadatas is None:
             metadatas = [""] * len(ids)
         if documents is None:
             documents = [""] * len(ids)
+        start = time.perf_counter()
         collection.add(
             documents=documents,
             embeddings=embeddings,
             ids=ids,
             metadatas=metadatas
         )
+        _record_write("add", collection_name, len(ids), time.perf_counter() - start)
+        bump_write_stamp(client, collection_name)
         print(f"Inseriti {len(ids)} punti in batch in '{collection_name}'.")
+        return True
+    except Exception as e:
+        _record_error("add", collection_name, e)
+        print(f"Errore inserimento batch: {e}")
+        return False
+
+def get_existing_ids(client, collection_name, page_size=10_000):
+    """
+    Restituisce l'insieme degli id presenti nella collezione.
+    Scorre la collezione a pagine leggendo solo gli id (include=[]), senza documenti né metadata.
+    """
+    existing = set()
+    try:
+        collection = client.get_collection(collection_name)
+        offset = 0
+        while True:
+            page = collection.get(include=[], limit=page_size, offset=offset)["ids"]
+            existing.update(page)
+            if len(page) < page_size:
+                break
+            offset += page_size
+    except Exception as e:
+        _record_error("get", collection_name, e)
+        print(f"Errore lettura id: {e}")
+    return existing
+
+
+def filter_existing_ids(client, collection_name, candidate_ids, page_size=5_000):
+    """
+    Restituisce il sottoinsieme di candidate_ids già presente nella collezione,
+    interrogando Chroma solo per gli id candidati.
+    """
+    candidate_ids = list(dict.fromkeys(candidate_ids))
+    existing = set()
+    try:
+        collection = client.get_collection(collection_name)
+        for start in range(0, len(candidate_ids), page_size):
+            page = candidate_ids[start:start + page_size]
+            existing.update(collection.get(ids=page, include=[])["ids"])
     except Exception as e:
-        print(f"Errore inserimento batch: {e}")
\ No newline at end of file
+        _record_error("get", collection_name, e)
+        print(f"Errore lettura id: {e}")
+    return existing
+
+
+def upsert_points_batch(client, collection_name, ids, embeddings, metadatas=None, documents=None):
+    """
+    Come insert_points_batch, ma aggiorna i punti con id già presenti invece di scartarli.
+    Restituisce True se il batch è stato scritto.
+    """
+    try:
+        collection = client.get_collection(collection_name)
+        if isinstance(embeddings, np.ndarray):
+            embeddings = embeddings.tolist()
+        if metadatas is None:
+            metadatas = [""] * len(ids)
+        if documents is None:
+            documents = [""] * len(ids)
+        start = time.perf_counter()
+        collection.upsert(
+            documents=documents,
+            embeddings=embeddings,
+            ids=ids,
+            metadatas=metadatas
+        )
+        _record_write("upsert", collection_name, len(ids), time.perf_counter() - start)
+        bump_write_stamp(client, collection_name)
+        print(f"Aggiornati {len(ids)} punti in batch in '{collection_name}'.")
+        return True
+    except Exception as e:
+        _record_error("upsert", collection_name, e)
+        print(f"Errore upsert batch: {e}")
+        return False
+
+
+def delete_points(client, collection_name, ids, page_size=5_000):
+    """
+    Elimina dalla collezione i punti con gli id indicati (gli id assenti sono ignorati).
+    Restituisce True se l'eliminazione è riuscita.
+    """
+    ids = list(ids)
+    try:
+        collection = client.get_collection(collection_name)
+        for start in range(0, len(ids), page_size):
+            collection.delete(ids=ids[start:start + page_size])
+        if ids:
+            bump_write_stamp(client, collection_name)
+            print(f"Eliminati {len(ids)} punti da '{collection_name}'.")
+        return True
+    except Exception as e:
+        _record_error("delete", collection_name, e)
+        print(f"Errore eliminazione punti: {e}")
+        return False
+
+
+def update_metadatas(client, collection_name, ids, metadatas):
+    """Aggiorna solo i metadata di punti già presenti, senza toccare gli embedding."""
+    try:
+        collection = client.get_collection(collection_name)
+        collection.update(ids=ids, metadatas=metadatas)
+        bump_write_stamp(client, collection_name)
+    except Exception as e:
+        _record_error("update", collection_name, e)
+        print(f"Errore aggiornamento metadata: {e}")
+
+
+def export_collection_embeddings(client, collection_name, page_size=5_000, include_metadatas=False):
+    """
+    Legge a pagine id ed embedding (ed eventualmente metadata) di tutta la collezione.
+    Restituisce (ids, matrice float32 (n, dim), metadatas o None).
+    """
+    collection = client.get_collection(collection_name)
+    include = ["embeddings", "metadatas"] if include_metadatas else ["embeddings"]
+    ids, blocks, metadatas = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        if len(page["ids"]) == 0:
+            break
+        ids.extend(page["ids"])
+        blocks.append(np.asarray(page["embeddings"], dtype=np.float32))
+        if include_metadatas:
+            metadatas.extend(page["metadatas"])
+        if len(page["ids"]) < page_size:
+            break
+        offset += page_size
+    embeddings = np.vstack(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+    return ids, embeddings, (metadatas if include_metadatas else None)
@@ -0,0 +1,171 @@
+import os
+import numpy as np
+
+from pathlib import Path
+from src.utils.utils_similarity import blocked_top_k, normalize_rows
+
+
+def projection_path(chroma_db_path: str) -> Path:
+    """
+    Proiezione condivisa da tutte le collezioni del database: job post, curriculum e query
+    devono stare nello stesso spazio ridotto per essere confrontabili.
+    """
+    return Path(chroma_db_path) / "projection.npz"
+
+
+class ProjectionFitError(ValueError):
+    """Dati insufficienti per stimare la proiezione: l'ingestion si ferma invece di scartare il blocco."""
+
+
+class PCAProjection:
+    """
+    Proiezione degli embedding sulle prime dim componenti principali (SVD troncata, senza
+    centrare). La proiezione perde l'energia fuori dalle dim componenti, quindi le norme
+    si accorciano in modo diverso per ogni vettore: transform riporta i vettori a norma 1,
+    così nello spazio ridotto L2 (Chroma, rerank_candidates) e coseno (shortlist, matching
+    in blocco, exact_search) danno lo stesso ordinamento. L'ordinamento rispetto agli
+    embedding completi cambia comunque un po': è quello che misura compression_recall_report.
+
+    Le proiezioni salvate prima della normalizzazione (normalize=False) restano come sono,
+    per non mescolare vettori già indicizzati e query in spazi diversi.
+    """
+
+    def __init__(self, components: np.ndarray, explained_variance_ratio: np.ndarray, normalize: bool = True):
+        self.components = components
+        self.explained_variance_ratio = explained_variance_ratio
+        self.normalize = normalize
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, embeddings, dim: int):
+        """Stima la proiezione da un campione di almeno dim embedding."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or len(embeddings) < dim or embeddings.shape[1] < dim:
+            raise ProjectionFitError(f"Servono almeno {dim} embedding di dimensione >= {dim} per stimare la proiezione (ricevuti {embeddings.shape})")
+        _, singular_values, vt = np.linalg.svd(embeddings, full_matrices=False)
+        variance = singular_values ** 2
+        return cls(vt[:dim].astype(np.float32), (variance[:dim] / variance.sum()).astype(np.float32))
+
+    def transform(self, embeddings) -> np.ndarray:
+        """Proietta una matrice (n, input_dim) o un singolo vettore (a norma 1, vedi la classe)."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        projected = embeddings @ self.components.T
+        if not self.normalize:
+            return projected
+        norms = np.linalg.norm(projected, axis=-1, keepdims=True)
+        return projected / np.maximum(norms, 1e-12)
+
+    def save(self, path):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        tmp_path = Path(path).with_name(Path(path).stem + ".tmp.npz")
+        np.savez(
+            tmp_path, components=self.components, explained_variance_ratio=self.explained_variance_ratio,
+            normalize=np.asarray(self.normalize)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Carica la proiezione, None se il file non esiste."""
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            normalize = bool(data["normalize"]) if "normalize" in data.files else False
+            projection = cls(data["components"], data["explained_variance_ratio"], normalize=normalize)
+        if not normalize:
+            print(f"[ATTENZIONE] La proiezione in {path} non normalizza i vettori: L2 e coseno possono dare "
+                  f"ordinamenti diversi. Eliminala e reindicizza le collezioni per usare quella normalizzata.")
+        return projection
+
+
+def ensure_projection(path, embeddings, dim: int) -> PCAProjection:
+    """
+    Proiezione salvata in path; se non esiste viene stimata su embeddings e salvata.
+    Una proiezione esistente con dimensione diversa da dim è un errore: le collezioni già
+    indicizzate con quella proiezione non sarebbero più confrontabili.
+    """
+    projection = PCAProjection.load(path)
+    if projection is None:
+        projection = PCAProjection.fit(embeddings, dim)
+        projection.save(path)
+        print(f"Proiezione PCA {projection.input_dim} -> {dim} stimata su {len(embeddings)} embedding "
+              f"(energia conservata {projection.explained_variance_ratio.sum():.1%}) -> {path}")
+    elif projection.dim != dim:
+        raise ValueError(f"La proiezione in {path} ha dimensione {projection.dim}, richiesta {dim}: eliminala e reindicizza tutte le collezioni")
+    return projection
+
+
+def make_projector(path, dim: int):
+    """
+    Funzione embeddings -> embeddings proiettati per l'ingestion: la prima chiamata carica la
+    proiezione da path o, se non esiste, la stima sul primo blocco di embedding. Se quel blocco
+    ha meno di dim embedding solleva ProjectionFitError: l'ingestion va interrotta (blocchi più
+    grandi o più dati), non basta saltare il blocco.
+    """
+    projection = PCAProjection.load(path)
+    if projection is not None and projection.dim != dim:
+        # controllo anticipato: meglio fermarsi prima di codificare che scartare ogni blocco
+        raise ValueError(f"La proiezione in {path} ha dimensione {projection.dim}, richiesta {dim}: eliminala e reindicizza tutte le collezioni")
+
+    def project(embeddings):
+        nonlocal projection
+        if projection is None:
+            projection = ensure_projection(path, embeddings, dim)
+        return projection.transform(embeddings)
+
+    return project
+
+
+def quantize_int8(vectors, scale: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizza a int8 con una scala per dimensione (max |x| / 127).
+    Restituisce (vettori int8, scala float32); vectors ≈ int8 * scala.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if scale is None:
+        scale = np.maximum(np.abs(vectors).max(axis=0), 1e-12) / 127.0
+    quantized = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return quantized, scale.astype(np.float32)
+
+
+def _exact_top_k(queries, corpus, k, normalized=False):
+    indices, _ = blocked_top_k(queries, corpus, k=k, normalized=normalized)
+    return indices
+
+
+def _recall(reference: np.ndarray, approx: np.ndarray) -> float:
+    return float(np.mean([len(set(r) & set(a)) / len(r) for r, a in zip(reference, approx)]))
+
+
+def compression_recall_report(vectors, queries, k: int = 10, projection: PCAProjection | None = None, int8: bool = True) -> dict:
+    """
+    Recall@k rispetto alla ricerca esatta sui vettori completi, per la proiezione PCA
+    (corpus e query proiettati) e/o per la quantizzazione int8 del corpus.
+    vectors sono gli embedding completi della collezione (es. l'export di exact_search).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    reference = _exact_top_k(queries, vectors, k)
+    report = {"k": k, "n_queries": len(queries), "n_vectors": len(vectors), "full_dim": vectors.shape[1]}
+    if projection is not None:
+        # vettori proiettati unitari: L2 di Chroma e coseno danno lo stesso top-k
+        approx = _exact_top_k(projection.transform(queries), projection.transform(vectors), k)
+        report["pca"] = {
+            "dim": projection.dim,
+            "explained_energy": float(projection.explained_variance_ratio.sum()),
+            "recall": _recall(reference, approx),
+            "size_ratio": projection.dim / vectors.shape[1],
+        }
+    if int8:
+        quantized, scale = quantize_int8(normalize_rows(vectors))
+        # prodotto scalare con il corpus dequantizzato = query scalata per dimensione . int8
+        approx = _exact_top_k(normalize_rows(queries) * scale, quantized, k, normalized=True)
+        report["int8"] = {"recall": _recall(reference, approx), "size_ratio": 0.25}
+    return report
@@ -0,0 +1,179 @@
+import os
+import zlib
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_MAX_HASH = np.uint64(_MERSENNE_PRIME)
+
+
+def dedup_index_path(chroma_db_path: str, collection_name: str) -> Path:
+    """File dell'indice dei quasi duplicati, salvato accanto al database Chroma."""
+    return Path(chroma_db_path) / "dedup" / f"{collection_name}.npz"
+
+
+def invalidate_dedup_index(chroma_db_path: str, collection_name: str):
+    """Elimina l'indice dei quasi duplicati di collection_name (es. quando la collezione viene ricreata)."""
+    path = dedup_index_path(chroma_db_path, collection_name)
+    if path.is_file():
+        path.unlink()
+        print(f"Indice dei quasi duplicati invalidato: {path}")
+
+
+def shingles(text: str, shingle_size: int = 5) -> set[str]:
+    """Shingle di shingle_size parole consecutive (il testo intero se è più corto)."""
+    words = text.split()
+    if len(words) <= shingle_size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+
+
+def _lsh_params(threshold: float, num_perm: int) -> tuple[int, int]:
+    """
+    Sceglie (bande, righe per banda) con soglia LSH (1/b)^(1/r) un po' sotto threshold:
+    i candidati vengono poi verificati sulla firma, quindi conviene perdere pochi veri duplicati.
+    """
+    candidates = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    lsh_threshold = lambda br: (1 / br[0]) ** (1 / br[1])
+    below = [br for br in candidates if lsh_threshold(br) <= threshold - 0.1]
+    if not below:
+        return min(candidates, key=lsh_threshold)
+    return max(below, key=lsh_threshold)
+
+
+class NearDuplicateIndex:
+    """
+    Indice MinHash LSH per riconoscere testi quasi duplicati.
+
+    Vengono indicizzati solo i rappresentanti: ogni nuovo testo viene confrontato con i
+    rappresentanti già visti e, se la similarità di Jaccard stimata sui shingle supera
+    threshold, viene assegnato a quel gruppo invece di diventare un nuovo rappresentante.
+
+    Firme dei rappresentanti e membri dei gruppi si salvano con save() accanto alla collezione,
+    così una nuova esecuzione riconosce sia i duplicati dei rappresentanti già scritti sia i
+    membri già accorpati (che non sono punti della collezione).
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+        self._buckets = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures = {}
+        self._members = {}  # id del membro -> id del rappresentante
+        self.count = None  # punti della collezione quando l'indice è stato salvato
+
+    def signature(self, text: str) -> np.ndarray | None:
+        """Firma MinHash (num_perm,) del testo, None se il testo è vuoto."""
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return None
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        hashes %= _MAX_HASH
+        # (a * x + b) mod p per ogni permutazione: x < 2^31 e a < 2^31, quindi niente overflow
+        permuted = (hashes[:, None] * self._a[None, :] + self._b[None, :]) % _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, doc_id: str, text: str) -> str | None:
+        """
+        Se il testo è un quasi duplicato di un rappresentante già indicizzato restituisce
+        l'id del rappresentante, altrimenti lo indicizza come nuovo rappresentante e restituisce None.
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        best_id, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float((self._signatures[candidate] == signature).mean())
+            if similarity >= best_similarity:
+                best_id, best_similarity = candidate, similarity
+        if best_id is not None:
+            return best_id
+
+        self._index(doc_id, signature)
+        return None
+
+    def _index(self, doc_id: str, signature: np.ndarray):
+        self._signatures[doc_id] = signature
+        for band, key in self._band_keys(signature):
+            self._buckets[band][key].append(doc_id)
+
+    def add_representative(self, doc_id: str, text: str):
+        """Indicizza il testo come rappresentante senza cercarne i duplicati (es. punti già nella collezione)."""
+        signature = self.signature(text)
+        if signature is not None and doc_id not in self._signatures:
+            self._index(doc_id, signature)
+
+    def discard(self, doc_ids):
+        """Rimuove dei rappresentanti (es. non scritti nella collezione); gli id sconosciuti vengono ignorati."""
+        for doc_id in doc_ids:
+            signature = self._signatures.pop(doc_id, None)
+            if signature is None:
+                continue
+            for band, key in self._band_keys(signature):
+                bucket = self._buckets[band][key]
+                bucket.remove(doc_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def add_members(self, rep_id: str, member_ids):
+        """Registra i membri del gruppo di rep_id (da fare solo dopo che rep_id è stato scritto)."""
+        for member_id in member_ids:
+            self._members[member_id] = rep_id
+
+    def is_member(self, doc_id: str) -> bool:
+        """True se doc_id è già stato accorpato a un rappresentante."""
+        return doc_id in self._members
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._signatures
+
+    def is_compatible(self, threshold: float, num_perm: int = 128, shingle_size: int = 5, seed: int = 1) -> bool:
+        return (self.threshold, self.num_perm, self.shingle_size, self.seed) == (threshold, num_perm, shingle_size, seed)
+
+    def is_valid(self, count: int) -> bool:
+        """L'indice è valido solo se la collezione non è cambiata di dimensione dopo il salvataggio."""
+        return self.count == count
+
+    def save(self, path, count: int):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        tmp_path = Path(path).with_name(Path(path).stem + ".tmp.npz")
+        rep_ids = list(self._signatures)
+        signatures = np.array([self._signatures[i] for i in rep_ids], dtype=np.uint64).reshape(len(rep_ids), self.num_perm)
+        np.savez(
+            tmp_path,
+            params=np.array([self.threshold, self.num_perm, self.shingle_size, self.seed, count], dtype=np.float64),
+            rep_ids=np.array(rep_ids, dtype=str),
+            signatures=signatures,
+            member_ids=np.array(list(self._members), dtype=str),
+            member_reps=np.array(list(self._members.values()), dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Carica l'indice, None se il file non esiste."""
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            threshold, num_perm, shingle_size, seed, count = data["params"]
+            index = cls(float(threshold), int(num_perm), int(shingle_size), int(seed))
+            index.count = int(count)
+            for doc_id, signature in zip(data["rep_ids"].tolist(), data["signatures"]):
+                index._index(doc_id, signature)
+            index._members = dict(zip(data["member_ids"].tolist(), data["member_reps"].tolist()))
+        return index
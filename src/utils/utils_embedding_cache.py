@@ -0,0 +1,195 @@
+import re
+import time
+import atexit
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# parametri per query IN (...): sotto il limite di variabili di SQLite
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """Normalizza il testo usato come chiave di cache (spazi compressi, strip)."""
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def embedding_cache_key(model_name: str, text: str) -> str:
+    """Chiave di cache: hash di (nome modello, testo normalizzato)."""
+    return hashlib.sha1(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache persistente degli embedding indicizzata per (modello, hash del testo normalizzato).
+
+    I vettori stanno in un database SQLite (cache.sqlite, modalità WAL) nella cartella del modello:
+    app Streamlit e ingestion possono usarla insieme, perché ogni scrittura è una transazione
+    e SQLite serializza gli scrittori tra processi. Oltre max_size_mb vengono eliminate le voci
+    usate meno di recente, subito dopo ogni inserimento. Gli aggiornamenti dell'ultimo utilizzo
+    degli hit sono accumulati in memoria e scritti con il prossimo put_many, con save() o all'uscita.
+    """
+
+    _TOUCH_FLUSH = 1000  # aggiornamenti di ultimo utilizzo accumulati prima di scriverli
+
+    def __init__(self, cache_dir="./embedding_cache", model_name="all-mpnet-base-v2", max_size_mb=2048):
+        self.model_name = model_name
+        self.dir = Path(cache_dir) / re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.dir / "cache.sqlite"
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.RLock()
+        self._touched = {}  # chiave -> ultimo utilizzo, non ancora scritto
+        self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._dim = self._meta("dim")
+        atexit.register(self.save)
+
+    def _meta(self, name: str):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, name: str, value: int):
+        self._conn.execute("INSERT INTO meta (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value", (name, value))
+
+    def _count(self) -> int:
+        return self._meta("count") or 0
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()])
+            self._touched = {}
+
+    def save(self):
+        """Scrive su disco gli ultimi utilizzi accumulati (i vettori sono già scritti da put_many)."""
+        with self._lock:
+            if not self._touched:
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_touched()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- gestione spazio ---
+    @property
+    def max_entries(self) -> int:
+        if self._dim is None:
+            return 0
+        return max(1, self.max_bytes // (self._dim * 4))
+
+    def _evict(self):
+        """Elimina le voci meno usate di recente finché non sono al più max_entries."""
+        overflow = self._count() - self.max_entries
+        if overflow <= 0:
+            return
+        deleted = self._conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used LIMIT ?)", (overflow,)
+        ).rowcount
+        self._set_meta("count", self._count() - deleted)
+        self.evictions += deleted
+
+    # --- API ---
+    def get_many(self, texts: list[str]):
+        """
+        Cerca in cache gli embedding dei testi.
+        Restituisce (matrice (n, dim) con zeri per i miss oppure None, maschera booleana degli hit).
+        """
+        keys = [embedding_cache_key(self.model_name, t) for t in texts]
+        hit_mask = np.zeros(len(keys), dtype=bool)
+        with self._lock:
+            if self._dim is None:
+                self._dim = self._meta("dim")
+            if self._dim is None:
+                self.misses += len(keys)
+                return None, hit_mask
+            found = {}
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), _SQL_BATCH):
+                page = unique_keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(page))
+                found.update(self._conn.execute(f"SELECT key, vector FROM entries WHERE key IN ({placeholders})", page).fetchall())
+            out = np.zeros((len(keys), self._dim), dtype=np.float32)
+            now = time.time_ns()
+            for i, key in enumerate(keys):
+                vector = found.get(key)
+                if vector is None:
+                    continue
+                out[i] = np.frombuffer(vector, dtype=np.float32)
+                hit_mask[i] = True
+                self._touched[key] = now
+            n_hits = int(hit_mask.sum())
+            self.hits += n_hits
+            self.misses += len(keys) - n_hits
+            if len(self._touched) >= self._TOUCH_FLUSH:
+                self.save()
+        return out, hit_mask
+
+    def put_many(self, texts: list[str], embeddings: np.ndarray):
+        """Aggiunge (o aggiorna) in cache gli embedding dei testi, in una sola transazione."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        new_keys = {}
+        for text, vector in zip(texts, embeddings):
+            new_keys[embedding_cache_key(self.model_name, text)] = vector
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._dim = self._meta("dim")
+                if self._dim is None:
+                    self._dim = int(embeddings.shape[1])
+                    self._set_meta("dim", self._dim)
+                elif embeddings.shape[1] != self._dim:
+                    raise ValueError(f"Dimensione embedding {embeddings.shape[1]} diversa da quella in cache ({self._dim})")
+                # non si può tenere più di max_entries voci: si conservano le ultime
+                items = list(new_keys.items())[-self.max_entries:]
+                existing = set()
+                for start in range(0, len(items), _SQL_BATCH):
+                    page = [key for key, _ in items[start:start + _SQL_BATCH]]
+                    placeholders = ",".join("?" * len(page))
+                    existing.update(row[0] for row in self._conn.execute(f"SELECT key FROM entries WHERE key IN ({placeholders})", page))
+                now = time.time_ns()
+                self._conn.executemany(
+                    "INSERT INTO entries (key, vector, last_used) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET vector = excluded.vector, last_used = excluded.last_used",
+                    [(key, np.ascontiguousarray(vector).tobytes(), now) for key, vector in items]
+                )
+                self._set_meta("count", self._count() + sum(1 for key, _ in items if key not in existing))
+                self._flush_touched()
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        """Statistiche di utilizzo della cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._count()
+            return {
+                "model_name": self.model_name,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "size_mb": round(entries * (self._dim or 0) * 4 / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
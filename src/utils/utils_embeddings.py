@@ -0,0 +1,129 @@
+import numpy as np
+
+from src.utils.utils_metrics import METRICS
+
+
+class PaddingStats:
+    """
+    Conta i token reali e quelli di padding nei batch passati al modello con length_bucketing.
+    st_padded_tokens è il padding che avrebbe SentenceTransformer.encode da solo, che ordina
+    già i testi per numero di caratteri: è il termine di confronto per decidere se il
+    bucketing per token (che richiede una tokenizzazione in più) conviene.
+    """
+
+    def __init__(self):
+        self.tokens = 0
+        self.padded_tokens = 0
+        self.st_padded_tokens = 0
+
+    def update(self, batch_lengths: np.ndarray):
+        self.tokens += int(batch_lengths.sum())
+        self.padded_tokens += int(batch_lengths.max() * len(batch_lengths) - batch_lengths.sum())
+
+    def as_dict(self) -> dict:
+        total = self.tokens + self.padded_tokens
+        return {
+            "tokens": self.tokens,
+            "padded_tokens": self.padded_tokens,
+            "padding_ratio": round(self.padded_tokens / total, 4) if total else 0.0,
+            "st_padded_tokens": self.st_padded_tokens,
+        }
+
+
+def token_lengths(model, texts: list[str]) -> np.ndarray:
+    """Numero di token (troncato a max_seq_length) di ogni testo; lunghezza in caratteri se il modello non ha tokenizer."""
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    input_ids = tokenizer(
+        texts,
+        add_special_tokens=True,
+        truncation=True,
+        max_length=model.max_seq_length,
+    )["input_ids"]
+    return np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(texts))
+
+
+def _encode(model, texts: list[str], batch_size: int, show_progress_bar: bool) -> np.ndarray:
+    with METRICS.time("embedding_encode_seconds"):
+        embeddings = model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=show_progress_bar,
+        )
+    METRICS.inc("embedding_texts_total", len(texts))
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _encode_length_bucketed(model, texts: list[str], batch_size: int, show_progress_bar: bool, padding_stats=None) -> np.ndarray:
+    """
+    Ordina i testi per numero di token, codifica batch di lunghezza simile
+    e ripristina l'ordine originale, così il padding per batch è minimo.
+    Rispetto all'ordinamento per caratteri di SentenceTransformer.encode costa una
+    tokenizzazione in più: conviene solo se PaddingStats mostra un padding molto minore.
+    """
+    lengths = token_lengths(model, texts)
+    order = np.argsort(-lengths, kind="stable")
+    embeddings = None
+    starts = range(0, len(texts), batch_size)
+    if show_progress_bar:
+        from tqdm import tqdm
+        starts = tqdm(starts, desc="Batches")
+    for start in starts:
+        idx = order[start:start + batch_size]
+        batch = _encode(model, [texts[i] for i in idx], batch_size, False)
+        if embeddings is None:
+            embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+        embeddings[idx] = batch
+        if padding_stats is not None:
+            padding_stats.update(lengths[idx])
+    if padding_stats is not None:
+        # stesso ordinamento di SentenceTransformer.encode: lunghezza in caratteri decrescente
+        st_order = np.argsort([-len(t) for t in texts])
+        for start in range(0, len(texts), batch_size):
+            st_batch = lengths[st_order[start:start + batch_size]]
+            padding_stats.st_padded_tokens += int(st_batch.max() * len(st_batch) - st_batch.sum())
+    return embeddings
+
+
+def encode_texts(
+    model,
+    texts: list[str],
+    batch_size: int = 64,
+    show_progress_bar: bool = False,
+    cache=None,
+    length_bucketing: bool = False,
+    padding_stats: PaddingStats | None = None
+) -> np.ndarray:
+    """
+    Codifica una lista di testi in batch e restituisce un'unica matrice float32 (n, dim).
+    La conversione in liste Python va fatta solo al momento dell'inserimento in Chroma.
+    Se viene passata una EmbeddingCache, il modello calcola solo i testi non in cache.
+    SentenceTransformer.encode ordina già i testi per lunghezza in caratteri; con length_bucketing
+    i batch sono invece formati per numero di token (vedi PaddingStats per misurarne il guadagno).
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    def encode(batch_texts):
+        if length_bucketing and len(batch_texts) > 1 and not getattr(model, "sorts_internally", False):
+            return _encode_length_bucketed(model, batch_texts, batch_size, show_progress_bar, padding_stats)
+        return _encode(model, batch_texts, batch_size, show_progress_bar)
+
+    if cache is None:
+        return encode(texts)
+
+    embeddings, hit_mask = cache.get_many(texts)
+    miss_idx = np.flatnonzero(~hit_mask)
+    METRICS.inc("embedding_cache_hits_total", len(texts) - len(miss_idx))
+    if len(miss_idx) == 0:
+        return embeddings
+    miss_texts = [texts[i] for i in miss_idx]
+    miss_embeddings = encode(miss_texts)
+    cache.put_many(miss_texts, miss_embeddings)
+    if embeddings is None:
+        embeddings = np.empty((len(texts), miss_embeddings.shape[1]), dtype=np.float32)
+    embeddings[miss_idx] = miss_embeddings
+    return embeddings
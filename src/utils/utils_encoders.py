@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+
+# sentence_transformers (e quindi torch) viene importato solo quando serve un modello:
+# importarlo a livello di modulo rallenta l'avvio di chi usa solo le utility
+
+ENCODER_BACKENDS = ("sentence_transformers", "multiprocess", "quantized", "onnx")
+
+
+class MultiProcessEncoder:
+    """
+    Distribuisce l'encoding su un pool di processi CPU (uno per core di default).
+    Espone la stessa interfaccia di SentenceTransformer usata da encode_texts.
+    """
+
+    # il pool ordina già i testi per lunghezza e va chiamato con molti testi alla volta
+    sorts_internally = True
+
+    def __init__(self, model_name: str, n_workers: int | None = None):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.tokenizer = self.model.tokenizer
+        self.max_seq_length = self.model.max_seq_length
+        n_workers = n_workers or os.cpu_count() or 1
+        self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * n_workers)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True, show_progress_bar: bool = False):
+        if isinstance(texts, str):
+            return self.model.encode(texts, convert_to_numpy=convert_to_numpy)
+        return self.model.encode_multi_process(list(texts), self.pool, batch_size=batch_size)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+def _quantize_dynamic_int8(model):
+    """Quantizzazione dinamica int8 dei layer Linear (solo CPU)."""
+    import torch
+
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_encoder(backend: str = "sentence_transformers", model_name: str = "all-mpnet-base-v2", n_workers: int | None = None):
+    """
+    Crea l'encoder per il backend richiesto:
+    - sentence_transformers: modello fp32 in-process (comportamento originale);
+    - multiprocess: pool di processi CPU;
+    - quantized: modello con Linear quantizzati dinamicamente a int8;
+    - onnx: export ONNX tramite il backend di sentence-transformers (richiede optimum/onnxruntime).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "sentence_transformers":
+        return SentenceTransformer(model_name)
+    if backend == "multiprocess":
+        return MultiProcessEncoder(model_name, n_workers=n_workers)
+    if backend == "quantized":
+        return _quantize_dynamic_int8(SentenceTransformer(model_name, device="cpu"))
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx")
+    raise ValueError(f"Backend encoder non supportato: {backend} (disponibili: {', '.join(ENCODER_BACKENDS)})")
+
+
+def close_encoder(encoder):
+    """Rilascia le risorse dell'encoder (il pool di processi, se presente)."""
+    close = getattr(encoder, "close", None)
+    if callable(close):
+        close()
+
+
+def encoder_cache_name(model_name: str, backend: str) -> str:
+    """Nome usato per la cache degli embedding: backend diversi non condividono i vettori."""
+    return model_name if backend == "sentence_transformers" else f"{model_name}@{backend}"
+
+
+def check_encoder_parity(encoder, texts: list[str], reference=None, model_name: str = "all-mpnet-base-v2", batch_size: int = 32) -> dict:
+    """
+    Confronta gli embedding di un encoder con quelli del modello fp32 di riferimento
+    tramite similarità coseno riga per riga.
+    """
+    if reference is None:
+        from sentence_transformers import SentenceTransformer
+
+        reference = SentenceTransformer(model_name, device="cpu")
+    texts = list(texts)
+    expected = np.asarray(reference.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    actual = np.asarray(encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True) + 1e-12
+    actual /= np.linalg.norm(actual, axis=1, keepdims=True) + 1e-12
+    cosine = (expected * actual).sum(axis=1)
+    return {
+        "n_texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "p5_cosine": float(np.percentile(cosine, 5)),
+    }
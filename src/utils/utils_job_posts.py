@@ -1,3 +1,6 @@
+import os
+import pickle
+import hashlib
 import pandas as pd
 import numpy as np
 import re
@@ -19,20 +22,68 @@ def get_nlp():
         spacy_download("en_core_web_sm")
         return spacy.load("en_core_web_sm", disable=["parser", "ner"])
 
+# equivalenti a (<br\s*/?>)+ con IGNORECASE e a \s+ -> ' ', ma più veloci: il primo inizia
+# con un letterale, il secondo salta gli spazi singoli (che resterebbero invariati)
+_BR_RE = re.compile(r'<[bB][rR]\s*/?>(?:<[bB][rR]\s*/?>)*')
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'[^\S ]\s*| \s+')
+# separatore per pulire un'intera colonna come un'unica stringa: non è uno spazio
+# e non può comparire dentro un tag, quindi nessun pattern lo attraversa
+_CELL_SEP = "\x00"
+_TAG_COLUMN_RE = re.compile(r'<[^>\x00]+>')
+
 def clean_html_and_normalize(text: str) -> str:
     """Rimuove HTML, decode entità, normalizza spazi e minuscole."""
     if pd.isna(text) or not isinstance(text, str):
         return ""
-    text = re.sub(r'(<br\s*/?>)+', '\n', text, flags=re.IGNORECASE)
-    text = re.sub(r'<[^>]+>', ' ', text)
+    text = _BR_RE.sub('\n', text)
+    text = _TAG_RE.sub(' ', text)
     text = html.unescape(text)
-    text = re.sub(r'\s+', ' ', text)
+    text = _SPACE_RE.sub(' ', text)
     return text.strip()
 
-def tokenize_and_lemmatize(text: str, min_len=2, remove_stop=True) -> list[str]:
-    """Tokenizza, rimuove stopword/punteggiatura, fa lemmatizzazione."""
-    nlp = get_nlp()
-    doc = nlp(text)
+def clean_html_column(texts: pd.Series, lowercase: bool = False) -> pd.Series:
+    """
+    Versione per colonna di clean_html_and_normalize, con lo stesso risultato cella per cella.
+    Le celle di testo vengono unite in un'unica stringa e ogni pattern viene applicato una
+    volta sola sull'intera colonna; i valori non testuali diventano "".
+    """
+    is_text = texts.map(type).eq(str)
+    cleaned = pd.Series("", index=texts.index, dtype=object)
+    values = texts[is_text]
+    if values.empty:
+        return cleaned
+    if lowercase:
+        values = values.str.lower()
+    if values.str.contains(_CELL_SEP, regex=False).any():
+        # caso raro: il separatore compare nel testo, si pulisce cella per cella
+        cleaned[is_text] = values.map(clean_html_and_normalize)
+        return cleaned
+    joined = _CELL_SEP.join(values.tolist())
+    joined = _BR_RE.sub('\n', joined)
+    joined = _TAG_COLUMN_RE.sub(' ', joined)
+    joined = html.unescape(joined)
+    joined = _SPACE_RE.sub(' ', joined)
+    cleaned[is_text] = [cell.strip() for cell in joined.split(_CELL_SEP)]
+    return cleaned
+
+def check_clean_html_parity(texts, lowercase: bool = False, max_examples: int = 5) -> dict:
+    """Confronta clean_html_column con clean_html_and_normalize applicata cella per cella."""
+    texts = pd.Series(texts)
+    expected = (texts.str.lower() if lowercase else texts).map(clean_html_and_normalize)
+    actual = clean_html_column(texts, lowercase=lowercase)
+    mismatch = expected.ne(actual)
+    return {
+        "n_rows": int(len(texts)),
+        "n_mismatches": int(mismatch.sum()),
+        "examples": [
+            {"index": idx, "expected": expected[idx], "actual": actual[idx]}
+            for idx in mismatch[mismatch].index[:max_examples]
+        ],
+    }
+
+def _doc_lemmas(doc, min_len=2, remove_stop=True) -> list[str]:
+    """Lemmi di un Doc spaCy già elaborato (stessi filtri di tokenize_and_lemmatize)."""
     tokens = []
     for tok in doc:
         if remove_stop and tok.is_stop:
@@ -47,6 +98,69 @@ def tokenize_and_lemmatize(text: str, min_len=2, remove_stop=True) -> list[str]:
         tokens.append(lemma)
     return tokens
 
+def tokenize_and_lemmatize(text: str, min_len=2, remove_stop=True) -> list[str]:
+    """Tokenizza, rimuove stopword/punteggiatura, fa lemmatizzazione."""
+    nlp = get_nlp()
+    return _doc_lemmas(nlp(text), min_len=min_len, remove_stop=remove_stop)
+
+def text_hash(text: str) -> str:
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+def load_token_cache(path: str) -> dict:
+    """Cache hash del testo pulito -> lemmi, vuota se il file non esiste."""
+    if not path or not os.path.isfile(path):
+        return {}
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def save_token_cache(path: str, cache: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def pretokenize_corpus(texts: list[str], batch_size=256, n_process=1, cache: dict | None = None, min_len=2, remove_stop=True, prune=False) -> list[list[str]]:
+    """
+    Pulisce e lemmatizza un intero corpus con nlp.pipe (a batch, eventualmente su più processi).
+    I testi uguali dopo la pulizia vengono elaborati una volta sola e i lemmi vengono
+    salvati in cache per hash, così le esecuzioni successive rielaborano solo i testi nuovi.
+    Con prune la cache tiene solo i testi del corpus (quelli rimossi o modificati escono).
+    """
+    if cache is None:
+        cache = {}
+    cleaned = [clean_html_and_normalize(t) for t in texts]
+    keys = [text_hash(t) for t in cleaned]
+    missing = {}
+    for key, text in zip(keys, cleaned):
+        if key not in cache and key not in missing:
+            missing[key] = text
+    if missing:
+        nlp = get_nlp()
+        docs = nlp.pipe(missing.values(), batch_size=batch_size, n_process=n_process)
+        for key, doc in zip(missing.keys(), docs):
+            cache[key] = _doc_lemmas(doc, min_len=min_len, remove_stop=remove_stop)
+    if prune:
+        for key in set(cache).difference(keys):
+            del cache[key]
+    return [cache[key] for key in keys]
+
+class LemmaAnalyzer:
+    """
+    Analyzer per TfidfVectorizer: accetta liste di lemmi già calcolate (pretokenize_corpus)
+    oppure testo grezzo, che pulisce e lemmatizza. A differenza di una lambda è serializzabile
+    con pickle, quindi il vettorizzatore addestrato si può salvare o passare ai worker.
+    """
+
+    def __init__(self, min_len=2, remove_stop=True):
+        self.min_len = min_len
+        self.remove_stop = remove_stop
+
+    def __call__(self, doc):
+        if isinstance(doc, (list, tuple)):
+            return list(doc)
+        return tokenize_and_lemmatize(clean_html_and_normalize(doc), min_len=self.min_len, remove_stop=self.remove_stop)
+
 def join_tokens(tokens: list[str]) -> str:
     return " ".join(tokens)
 
@@ -56,14 +170,22 @@ def top_n_terms_corpus(corpus: list[str], n=20):
         counter.update(doc.split())
     return counter.most_common(n)
 
-def compute_tfidf_features(texts: list[str], max_features=2000):
-    """Restituisce matrice TF-IDF e il vettorizzatore (con tokenizer custom)."""
+def compute_tfidf_features(texts: list[str], max_features=2000, batch_size=256, n_process=1, token_cache_path: str | None = None):
+    """
+    Restituisce matrice TF-IDF e il vettorizzatore (con analyzer custom).
+    Il corpus viene lemmatizzato prima del fit con pretokenize_corpus; con token_cache_path
+    i lemmi vengono riletti e aggiornati su disco.
+    """
+    cache = load_token_cache(token_cache_path)
+    n_cached = len(cache)
+    tokens = pretokenize_corpus(texts, batch_size=batch_size, n_process=n_process, cache=cache)
+    if token_cache_path and len(cache) != n_cached:
+        save_token_cache(token_cache_path, cache)
     vectorizer = TfidfVectorizer(
-        tokenizer=lambda t: tokenize_and_lemmatize(t),
-        preprocessor=clean_html_and_normalize,
+        analyzer=LemmaAnalyzer(),
         max_features=max_features
     )
-    tfidf_matrix = vectorizer.fit_transform(texts)
+    tfidf_matrix = vectorizer.fit_transform(tokens)
     return tfidf_matrix, vectorizer
 
 def top_tfidf_terms_for_doc(row_idx, matrix, vectorizer, top_k=10):
@@ -0,0 +1,159 @@
+import re
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+# pandas viene importato solo in ingestione: build_where serve anche all'app e al servizio
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Campi filtrabili delle job post: vengono normalizzati in ingestione (spazi compattati,
+# minuscolo) così un filtro di uguaglianza di Chroma li trova indipendentemente da come
+# sono scritti nel CSV. Lo stipendio viene convertito in salary_min/salary_max annui (float).
+JOB_POST_FILTER_FIELDS = ("city", "state", "country", "category", "job_type")
+SALARY_COLUMNS = ("salary_offered", "salary")
+
+# importi di stipendio: numero con simbolo di valuta e/o suffisso k ("$15", "40k", "$1,200.50")
+_SALARY_AMOUNT = r'([$€£])?\s*(\d[\d,]*(?:\.\d+)?)\s*([kK](?![A-Za-z]))?'
+_SALARY_RANGE_RE = re.compile(_SALARY_AMOUNT + r'\s*(?:-|–|—|to)\s*' + _SALARY_AMOUNT, re.IGNORECASE)
+_SALARY_SINGLE_RE = re.compile(r'([$€£])\s*(\d[\d,]*(?:\.\d+)?)\s*([kK](?![A-Za-z]))?')
+# periodo dello stipendio: cercato solo subito dopo l'importo ("/hr", "per hour", "a month",
+# "annually"), così "5% monthly bonus" o "40 hours per week" più avanti non contano
+_SALARY_PERIOD_PREFIX = r'\s*(?:/|per\b|an?\b|each\b)?\s*'
+_SALARY_PERIODS = (
+    (re.compile(_SALARY_PERIOD_PREFIX + r'(?:hour(?:ly|s)?|hrs?)\b', re.IGNORECASE), 2080),
+    (re.compile(_SALARY_PERIOD_PREFIX + r'(?:week(?:ly|s)?|wks?)\b', re.IGNORECASE), 52),
+    (re.compile(_SALARY_PERIOD_PREFIX + r'(?:month(?:ly|s)?|mos?)\b', re.IGNORECASE), 12),
+    (re.compile(_SALARY_PERIOD_PREFIX + r'(?:year(?:ly|s)?|yrs?|annum|annual(?:ly)?)\b', re.IGNORECASE), 1),
+)
+_SALARY_PERIOD_WINDOW = 20
+
+
+def normalize_filter_value(value) -> str | None:
+    """Valore di un campo filtrabile: testo minuscolo con spazi compattati, None se mancante."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    value = " ".join(str(value).split()).lower()
+    return value or None
+
+
+def _salary_amount(number: str, k: str) -> float:
+    return float(number.replace(",", "")) * (1000 if k else 1)
+
+
+def parse_salary(text) -> tuple[float, float]:
+    """
+    Stipendio (min, max) annuo da testi come "$15 - $20 /hour" o "40k-60k a year".
+    Si usa il primo intervallo di importi con valuta o suffisso k (o, in mancanza, il primo
+    importo con valuta); gli altri numeri del testo (bonus, percentuali, "401k") sono ignorati
+    e senza importi riconoscibili si restituisce (nan, nan). Il periodo ("/hr", "per month",
+    "annually") vale solo se segue subito l'importo; altrimenti si assume annuo.
+
+    >>> parse_salary("$15 - $20 /hour")
+    (31200.0, 41600.0)
+    >>> parse_salary("40k-60k a year")
+    (40000.0, 60000.0)
+    >>> parse_salary("$50k - $60k + 10% bonus")
+    (50000.0, 60000.0)
+    >>> parse_salary("$4,000 to $5,000 per month")
+    (48000.0, 60000.0)
+    >>> parse_salary("$55,000 a year")
+    (55000.0, 55000.0)
+    >>> parse_salary("$80,000 - $100,000 + 5% monthly bonus")
+    (80000.0, 100000.0)
+    >>> parse_salary("from $40000 to $50000 annually, 2 weeks vacation")
+    (40000.0, 50000.0)
+    >>> parse_salary("$60,000 a year, 3 months paid leave")
+    (60000.0, 60000.0)
+    >>> parse_salary("$70,000, 40 hours per week")
+    (70000.0, 70000.0)
+    >>> parse_salary("$18/hr, 40 hours per week")
+    (37440.0, 37440.0)
+    >>> parse_salary("401k match")
+    (nan, nan)
+    >>> parse_salary("DOE, 2 - 3 years of experience")
+    (nan, nan)
+    """
+    if not isinstance(text, str):
+        from src.utils.utils_job_posts import to_float
+
+        value = to_float(text)
+        return value, value
+    values, end = None, None
+    for match in _SALARY_RANGE_RE.finditer(text):
+        low_currency, low, low_k, high_currency, high, high_k = match.groups()
+        if not (low_currency or low_k or high_currency or high_k):
+            continue
+        # "40-60k": il suffisso dell'estremo superiore vale anche per quello inferiore
+        if high_k and not low_k and _salary_amount(low, "") <= _salary_amount(high, ""):
+            low_k = high_k
+        values, end = [_salary_amount(low, low_k), _salary_amount(high, high_k)], match.end()
+        break
+    if values is None:
+        single = _SALARY_SINGLE_RE.search(text)
+        if single is None:
+            return np.nan, np.nan
+        values, end = [_salary_amount(single.group(2), single.group(3))], single.end()
+    window = text[end:end + _SALARY_PERIOD_WINDOW]
+    factor = next((f for pattern, f in _SALARY_PERIODS if pattern.match(window)), 1)
+    return min(values) * factor, max(values) * factor
+
+
+def _metadata_value(value):
+    """Converte un valore in un tipo accettato da Chroma (str, int, float, bool), None se mancante."""
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, str):
+        return value
+    import pandas as pd
+
+    return None if pd.isna(value) else str(value)
+
+
+def job_post_metadatas(chunk: "pd.DataFrame", exclude=("uniq_id", "job_description")) -> list[dict]:
+    """
+    Metadata tipizzati per ogni riga del chunk: campi filtrabili normalizzati, stipendio
+    numerico e nessun valore mancante (Chroma non accetta None/NaN nei metadata).
+    """
+    metadata = chunk.drop(columns=[c for c in exclude if c in chunk.columns])
+    metadata = metadata.astype(object)
+    for field in JOB_POST_FILTER_FIELDS:
+        if field in metadata.columns:
+            metadata[field] = metadata[field].map(normalize_filter_value)
+    salary_column = next((c for c in SALARY_COLUMNS if c in metadata.columns), None)
+    if salary_column is not None:
+        salaries = metadata[salary_column].map(parse_salary)
+        metadata["salary_min"] = [low for low, _ in salaries]
+        metadata["salary_max"] = [high for _, high in salaries]
+
+    records = []
+    for record in metadata.to_dict(orient="records"):
+        typed = {key: _metadata_value(value) for key, value in record.items()}
+        records.append({key: value for key, value in typed.items() if value is not None})
+    return records
+
+
+def build_where(city=None, state=None, country=None, category=None, job_type=None, min_salary=None, max_salary=None) -> dict | None:
+    """
+    Filtro where di Chroma per i campi indicati (gli altri vengono ignorati), None se non
+    c'è nessun filtro. min_salary/max_salary selezionano le job post con una fascia
+    di stipendio annuo compatibile.
+    """
+    conditions = []
+    for field, value in (("city", city), ("state", state), ("country", country), ("category", category), ("job_type", job_type)):
+        value = normalize_filter_value(value)
+        if value is not None:
+            conditions.append({field: {"$eq": value}})
+    if min_salary is not None:
+        conditions.append({"salary_max": {"$gte": float(min_salary)}})
+    if max_salary is not None:
+        conditions.append({"salary_min": {"$lte": float(max_salary)}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# Bucket (secondi) degli istogrammi: da una query in cache (ms) a un OCR o un batch di encode lento
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("job_matcher")
+# senza configure_json_logging gli eventi non vengono scritti (niente fallback su stderr)
+logger.addHandler(logging.NullHandler())
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Contatori e istogrammi con etichette, condivisi dai thread del processo.
+    Ogni processo ha il suo registro (METRICS): i worker di estrazione inviano al processo
+    principale i propri valori con drain(), che vengono sommati con merge().
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name: str, text: str):
+        """Testo HELP della metrica nell'export Prometheus."""
+        self._help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _label_key(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """Registra la durata del blocco nell'istogramma name (in secondi), anche se solleva."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {key: [list(h[0]), h[1], h[2]] for key, h in self._histograms.items()},
+            }
+
+    def drain(self) -> dict:
+        """Restituisce i valori accumulati e azzera il registro."""
+        with self._lock:
+            data = {"counters": self._counters, "histograms": self._histograms}
+            self._counters, self._histograms = {}, {}
+        return data
+
+    def merge(self, data: dict):
+        """Somma i valori di uno snapshot/drain (es. di un altro processo)."""
+        with self._lock:
+            for key, value in data["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (counts, total, count) in data["histograms"].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                histogram[1] += total
+                histogram[2] += count
+
+    def reset(self):
+        self.drain()
+
+    def to_prometheus(self) -> str:
+        """Export nel formato di testo di Prometheus (versione 0.0.4)."""
+        data = self.snapshot()
+        lines = []
+        by_name = {}
+        for (name, key), value in data["counters"].items():
+            by_name.setdefault(name, ("counter", []))[1].append((key, value))
+        for (name, key), value in data["histograms"].items():
+            by_name.setdefault(name, ("histogram", []))[1].append((key, value))
+        for name in sorted(by_name):
+            kind, series = by_name[name]
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(series):
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Riepilogo leggibile (JSON): totali dei contatori, conteggio/media/p50/p95 approssimati degli istogrammi."""
+        data = self.snapshot()
+        result = {"counters": {}, "histograms": {}}
+        for (name, key), value in data["counters"].items():
+            result["counters"][name + _format_labels(key)] = value
+        for (name, key), (counts, total, count) in data["histograms"].items():
+            result["histograms"][name + _format_labels(key)] = {
+                "count": count,
+                "mean": total / count if count else None,
+                "p50_le": self._bucket_quantile(counts, count, 0.50),
+                "p95_le": self._bucket_quantile(counts, count, 0.95),
+            }
+        return result
+
+    def _bucket_quantile(self, counts, count, q):
+        """Limite superiore del bucket che contiene il quantile q (None se oltre l'ultimo bucket)."""
+        if not count:
+            return None
+        target, cumulative = q * count, 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return bound
+        return None
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("resume_extraction_seconds", "Durata di file_to_plain_text per formato")
+METRICS.describe("resume_extraction_errors_total", "File di curriculum non estratti per formato")
+METRICS.describe("embedding_encode_seconds", "Durata di un forward pass dell'encoder")
+METRICS.describe("embedding_texts_total", "Testi codificati dal modello")
+METRICS.describe("embedding_cache_hits_total", "Testi trovati nella cache degli embedding")
+METRICS.describe("chroma_write_seconds", "Durata delle scritture batch in Chroma")
+METRICS.describe("chroma_points_written_total", "Punti scritti in Chroma")
+METRICS.describe("chroma_errors_total", "Operazioni Chroma fallite")
+METRICS.describe("chroma_query_seconds", "Durata delle query a Chroma")
+METRICS.describe("chroma_shard_query_seconds", "Durata della query su un singolo shard")
+METRICS.describe("query_seconds", "Durata delle ricerche dell'app per stage")
+METRICS.describe("query_cache_hits_total", "Ricerche servite dalla cache dei risultati")
+
+
+def write_prometheus_file(path, registry: MetricsRegistry = METRICS) -> Path:
+    """
+    Scrive l'export Prometheus in path (es. per il textfile collector di node_exporter),
+    in modo atomico: chi legge non vede mai un file scritto a metà.
+    """
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.to_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+def start_metrics_server(port: int = 9108, host: str = "127.0.0.1", registry: MetricsRegistry = METRICS):
+    """Espone GET /metrics in formato Prometheus da un thread in background; restituisce il server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metriche Prometheus su http://{host}:{port}/metrics")
+    return server
+
+
+class JsonFormatter(logging.Formatter):
+    """Una riga JSON per record: timestamp, livello, evento e campi passati in extra={"fields": ...}."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "event": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_json_logging(path: str | None = None, level: int = logging.INFO):
+    """
+    Invia gli eventi di log_event a path (o su stderr) come righe JSON.
+    Senza questa chiamata gli eventi non vengono scritti.
+    """
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    """Evento strutturato (es. una scrittura in Chroma con durata e numero di punti)."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def configure_from_env():
+    """
+    Attiva l'export in base alle variabili d'ambiente:
+    JOB_MATCHER_JSON_LOG (file dei log JSON, "-" per stderr) e JOB_MATCHER_METRICS_PORT (endpoint /metrics).
+    Restituisce il server delle metriche, se avviato.
+    """
+    json_log = os.environ.get("JOB_MATCHER_JSON_LOG")
+    if json_log:
+        configure_json_logging(None if json_log == "-" else json_log)
+    port = os.environ.get("JOB_MATCHER_METRICS_PORT")
+    return start_metrics_server(int(port)) if port else None
+
+
+@contextmanager
+def profiled(name: str, output_dir: str | None = None):
+    """
+    Profila il blocco con cProfile se output_dir (o JOB_MATCHER_PROFILE_DIR) è impostato,
+    salvando <output_dir>/<name>_<pid>_<timestamp>.prof (apribile con snakeviz o pstats);
+    altrimenti non fa nulla. Per py-spy non serve: basta `py-spy record --pid <pid>`,
+    i thread della pipeline hanno già nomi riconoscibili.
+    """
+    output_dir = output_dir or os.environ.get("JOB_MATCHER_PROFILE_DIR")
+    if not output_dir:
+        yield
+        return
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"{name}_{os.getpid()}_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        print(f"Profilo salvato in {path}")
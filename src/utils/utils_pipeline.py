@@ -0,0 +1,94 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Channel:
+    """Coda limitata tra due stage: put blocca quando è piena (backpressure)."""
+
+    def __init__(self, maxsize: int, stop_event: threading.Event):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stop_event = stop_event
+
+    def put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self):
+        # il sentinella deve arrivare anche se la pipeline è stata interrotta
+        while True:
+            try:
+                self.queue.put(_DONE, timeout=0.1)
+                return
+            except queue.Full:
+                if self.stop_event.is_set():
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            if self.stop_event.is_set():
+                continue
+            yield item
+
+
+def run_pipeline(source, stages, queue_size: int = 4, name: str = "pipeline"):
+    """
+    Esegue source -> stages[0] -> stages[1] -> ... con ogni stage in un thread dedicato,
+    collegati da code di al più queue_size elementi, così gli stage lavorano in parallelo.
+
+    source è un iterabile; ogni stage è una funzione che riceve un iteratore e restituisce
+    un iteratore (tipicamente un generatore, che può accumulare batch e svuotarli alla fine).
+    Restituisce un generatore sugli elementi prodotti dall'ultimo stage. Se uno stage
+    solleva un'eccezione la pipeline si ferma e l'eccezione viene rilanciata al chiamante.
+    """
+    stop_event = threading.Event()
+    errors = []
+    channels = [_Channel(queue_size, stop_event) for _ in range(len(stages) + 1)]
+
+    def run_stage(produce, out_channel):
+        try:
+            for item in produce():
+                if not out_channel.put(item):
+                    break
+        except BaseException as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            out_channel.close()
+
+    threads = [threading.Thread(target=run_stage, args=(lambda: iter(source), channels[0]), name=f"{name}-source", daemon=True)]
+    for i, stage in enumerate(stages):
+        produce = (lambda stage=stage, inp=channels[i]: stage(iter(inp)))
+        threads.append(threading.Thread(target=run_stage, args=(produce, channels[i + 1]), name=f"{name}-{getattr(stage, '__name__', i)}", daemon=True))
+
+    def results():
+        for t in threads:
+            t.start()
+        exhausted = False
+        try:
+            yield from channels[-1]
+            exhausted = True
+        finally:
+            if not exhausted:
+                # uscita anticipata del chiamante: ferma gli stage e attende la sentinella finale
+                stop_event.set()
+                for _ in channels[-1]:
+                    pass
+            for t in threads:
+                t.join()
+            if errors:
+                raise errors[0]
+
+    return results()
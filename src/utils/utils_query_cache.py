@@ -0,0 +1,68 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from src.utils.utils_embedding_cache import normalize_text
+
+
+def query_cache_key(text: str, *extra) -> str:
+    """Hash della descrizione normalizzata (più eventuali parametri della query)."""
+    payload = "\x00".join([normalize_text(text), *map(str, extra)])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    """
+    Cache LRU in memoria con scadenza (ttl_seconds) e versione, condivisa tra i thread del processo.
+    Un valore salvato con una versione diversa da quella richiesta (es. il numero di
+    elementi nelle collezioni) viene considerato non valido.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # chiave -> (valore, versione, timestamp)
+
+    def get(self, key: str, version=None):
+        """Restituisce il valore in cache o None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_version, created = entry
+                expired = self.ttl_seconds is not None and time.monotonic() - created > self.ttl_seconds
+                if expired or entry_version != version:
+                    del self._entries[key]
+                    self.invalidations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value, version=None):
+        with self._lock:
+            self._entries[key] = (value, version, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def load_manifest(path) -> dict:
+    """Carica il manifest {path: {size, mtime_ns, hash}} (vuoto se non esiste)."""
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["files"]
+
+
+def load_pending_deletes(path) -> list:
+    """Id la cui eliminazione è fallita in una sync precedente, da ritentare."""
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("pending_deletes", [])
+
+
+def save_manifest(path, files: dict, pending_deletes=()):
+    """Salva il manifest (e gli id ancora da eliminare) in modo atomico."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "files": files, "pending_deletes": sorted(set(pending_deletes))}, f)
+    os.replace(tmp_path, path)
+
+
+def file_content_hash(path, block_size: int = 1 << 20) -> str:
+    """md5 del contenuto del file, letto a blocchi."""
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def plan_resume_sync(root_dir: Path, manifest: dict) -> dict:
+    """
+    Confronta i file sotto root_dir con il manifest e decide cosa fare.
+
+    I file con stessa dimensione e mtime del manifest sono considerati invariati senza
+    leggerne il contenuto. Per gli altri si calcola l'hash del contenuto, che fa da id:
+    - to_embed: {path: entry} contenuti mai visti, da estrarre e codificare;
+    - relinked: {path: entry} contenuti già in collezione (file spostati o copiati);
+    - stale_ids: id non più referenziati da nessun file (modificati o rimossi).
+    """
+    known_hashes = {entry["hash"] for entry in manifest.values()}
+    unchanged, to_embed, relinked = {}, {}, {}
+    new_hashes = set()
+
+    for p in root_dir.rglob("*"):
+        if not p.is_file():
+            continue
+        path = str(p)
+        st = p.stat()
+        old = manifest.get(path)
+        if old is not None and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            unchanged[path] = old
+            continue
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": file_content_hash(p)}
+        if entry["hash"] in known_hashes or entry["hash"] in new_hashes:
+            relinked[path] = entry
+        else:
+            new_hashes.add(entry["hash"])
+            to_embed[path] = entry
+
+    live_hashes = {e["hash"] for e in unchanged.values()} | {e["hash"] for e in relinked.values()} | new_hashes
+    return {
+        "unchanged": unchanged,
+        "to_embed": to_embed,
+        "relinked": relinked,
+        "removed": sorted(set(manifest) - set(unchanged) - set(to_embed) - set(relinked)),
+        "stale_ids": sorted(known_hashes - live_hashes),
+    }
@@ -1,6 +1,9 @@
 import os
+import hashlib
 from typing import Set
 import configparser
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from src.utils.utils_metrics import METRICS
 
 # Per DOCX
 try:
@@ -114,4 +117,90 @@ def file_to_plain_text(path: str) -> str:
     if ext not in EXTENSION_HANDLERS:
         raise ValueError(f"Estensione non supportata: {ext}")
     handler = EXTENSION_HANDLERS[ext]
-    return handler(path)
+    try:
+        with METRICS.time("resume_extraction_seconds", format=ext):
+            return handler(path)
+    except Exception:
+        METRICS.inc("resume_extraction_errors_total", format=ext)
+        raise
+
+def _init_extraction_worker():
+    # un processo per core: tesseract non deve aprire a sua volta più thread
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    # con fork il worker eredita le metriche del processo principale: non vanno rimandate indietro
+    METRICS.reset()
+
+IMAGE_EXTENSIONS = {"jpeg", "jpg", "png", "webp", "gif"}
+
+def make_thumbnail(path: str, thumbnail_dir: str, max_size: tuple[int, int] = (400, 400)) -> str | None:
+    """
+    Salva in thumbnail_dir una miniatura JPEG dell'immagine (primo frame per le GIF).
+    Restituisce il percorso della miniatura, None se il file non è un'immagine.
+    """
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext not in IMAGE_EXTENSIONS or Image is None:
+        return None
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    thumbnail_path = os.path.join(thumbnail_dir, hashlib.md5(str(path).encode()).hexdigest() + ".jpg")
+    with Image.open(path) as img:
+        img.seek(0)
+        thumb = img.convert("RGB")
+        thumb.thumbnail(max_size)
+        thumb.save(thumbnail_path, "JPEG", quality=85)
+    return thumbnail_path
+
+def _extract_chunk(paths: list[str], thumbnail_dir: str | None = None) -> list[tuple[str, str | None, str | None, str | None]]:
+    results = []
+    for path in paths:
+        try:
+            text = file_to_plain_text(path)
+        except Exception as e:
+            results.append((path, None, f"{type(e).__name__}: {e}", None))
+            continue
+        thumbnail = None
+        if thumbnail_dir:
+            try:
+                thumbnail = make_thumbnail(path, thumbnail_dir)
+            except Exception:
+                # la miniatura è solo un'anteprima: senza, la UI apre il file originale
+                thumbnail = None
+        results.append((path, text, None, thumbnail))
+    return results
+
+def _extract_chunk_in_worker(paths: list[str], thumbnail_dir: str | None = None):
+    # le metriche del worker tornano al processo principale insieme ai risultati
+    return _extract_chunk(paths, thumbnail_dir), METRICS.drain()
+
+def iter_plain_texts(paths: list[str], n_workers: int | None = None, chunk_size: int = 8, thumbnail_dir: str | None = None):
+    """
+    Estrae il testo da più file in parallelo con un pool di processi.
+    Genera tuple (path, testo, errore, miniatura) man mano che i chunk vengono completati
+    (quindi non nell'ordine di input); errore è None se l'estrazione è riuscita.
+    Con thumbnail_dir, per le immagini viene salvata anche una miniatura (altrimenti None).
+    Con n_workers=1 l'estrazione avviene nel processo corrente.
+    """
+    paths = [str(p) for p in paths]
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers <= 1:
+        for chunk in chunks:
+            yield from _extract_chunk(chunk, thumbnail_dir)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_extraction_worker) as executor:
+        # al più 2 chunk in volo per worker: la coda non cresce con il numero di file
+        pending = set()
+        chunk_iter = iter(chunks)
+        for chunk in chunk_iter:
+            pending.add(executor.submit(_extract_chunk_in_worker, chunk, thumbnail_dir))
+            if len(pending) >= 2 * n_workers:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results, metrics = future.result()
+                METRICS.merge(metrics)
+                yield from results
+                next_chunk = next(chunk_iter, None)
+                if next_chunk is not None:
+                    pending.add(executor.submit(_extract_chunk_in_worker, next_chunk, thumbnail_dir))
@@ -0,0 +1,258 @@
+import time
+import zlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.utils_metrics import METRICS
+
+# Una collezione logica "name" divisa in n shard è salvata come name_shard0 ... name_shard{n-1};
+# ogni shard ha nei metadata n_shards e il proprio indice, così il layout si riconosce in lettura.
+SHARD_SUFFIX = "_shard"
+
+
+def shard_collection_name(collection_name: str, shard: int) -> str:
+    return f"{collection_name}{SHARD_SUFFIX}{shard}"
+
+
+def shard_for_id(_id: str, n_shards: int) -> int:
+    """Shard di un id: crc32 stabile tra processi ed esecuzioni (hash() di Python non lo è)."""
+    return zlib.crc32(str(_id).encode("utf-8")) % n_shards
+
+
+def _group_by_shard(ids, n_shards: int) -> dict[int, list[int]]:
+    """Posizioni degli id raggruppate per shard."""
+    groups = {}
+    for position, _id in enumerate(ids):
+        groups.setdefault(shard_for_id(_id, n_shards), []).append(position)
+    return groups
+
+
+def _take(values, positions):
+    return None if values is None else [values[i] for i in positions]
+
+
+def _concat(parts: list[dict], keys) -> dict:
+    result = {"ids": []}
+    for key in keys:
+        result[key] = []
+    for part in parts:
+        result["ids"].extend(part["ids"])
+        for key in keys:
+            values = part.get(key)
+            if values is not None:
+                result[key].extend(values)
+    return result
+
+
+class ShardedCollection:
+    """
+    Collezione logica divisa in shard con la stessa interfaccia di una collezione Chroma
+    (add, upsert, update, delete, get, query, count): le scritture vengono instradate per id,
+    letture e query vengono eseguite su tutti gli shard in parallelo e unite.
+    Ogni shard ha il suo indice HNSW, quindi build e memoria per indice crescono con 1/n del corpus.
+    """
+
+    def __init__(self, name: str, shards: list, executor: ThreadPoolExecutor):
+        self.name = name
+        self.shards = shards
+        self._executor = executor
+
+    @property
+    def n_shards(self) -> int:
+        return len(self.shards)
+
+    @property
+    def metadata(self):
+        return self.shards[0].metadata
+
+    def _map(self, fn, items):
+        return list(self._executor.map(fn, items))
+
+    def count(self) -> int:
+        return sum(self._map(lambda shard: shard.count(), self.shards))
+
+    def _write(self, method: str, ids, **columns):
+        ids = list(ids)
+
+        def write(item):
+            shard, positions = item
+            kwargs = {key: _take(values, positions) for key, values in columns.items() if values is not None}
+            getattr(self.shards[shard], method)(ids=_take(ids, positions), **kwargs)
+
+        self._map(write, _group_by_shard(ids, self.n_shards).items())
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None):
+        self._write("add", ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None):
+        self._write("upsert", ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None):
+        self._write("update", ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def delete(self, ids=None, where=None):
+        if ids is None:
+            self._map(lambda shard: shard.delete(where=where), self.shards)
+            return
+        ids = list(ids)
+
+        def delete(item):
+            shard, positions = item
+            self.shards[shard].delete(ids=_take(ids, positions), where=where)
+
+        self._map(delete, _group_by_shard(ids, self.n_shards).items())
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("metadatas", "documents")):
+        """
+        Come Collection.get. Con ids interroga solo gli shard che li contengono; con limit/offset
+        le pagine scorrono gli shard in ordine, quindi l'export a pagine resta consistente.
+        """
+        include = list(include)
+        offset = offset or 0
+        if ids is not None:
+            ids = list(ids)
+            groups = _group_by_shard(ids, self.n_shards).items()
+            parts = self._map(lambda item: self.shards[item[0]].get(ids=_take(ids, item[1]), where=where, include=include), groups)
+            result = _concat(parts, include)
+        elif limit is None and offset == 0:
+            result = _concat(self._map(lambda shard: shard.get(where=where, include=include), self.shards), include)
+        elif where is None:
+            parts, remaining = [], limit
+            for shard, count in zip(self.shards, self._map(lambda shard: shard.count(), self.shards)):
+                if offset >= count:
+                    offset -= count
+                    continue
+                page = shard.get(limit=remaining, offset=offset, include=include)
+                parts.append(page)
+                offset = 0
+                if remaining is not None:
+                    remaining -= len(page["ids"])
+                    if remaining <= 0:
+                        break
+            return _concat(parts, include)
+        else:
+            # con un filtro il numero di risultati per shard non è noto: si filtra tutto e si taglia
+            result = _concat(self._map(lambda shard: shard.get(where=where, include=include), self.shards), include)
+        if offset or limit is not None:
+            end = None if limit is None else offset + limit
+            result = {key: values[offset:end] for key, values in result.items()}
+        return result
+
+    def query(self, query_embeddings, n_results: int = 10, where=None, include=("metadatas", "documents", "distances")):
+        """
+        Top-n_results di ogni shard per ogni query, uniti per distanza crescente:
+        il risultato è lo stesso di un'unica collezione con tutti i punti.
+        """
+        include = list(include)
+        shard_include = include if "distances" in include else include + ["distances"]
+
+        def query(item):
+            index, shard = item
+            start = time.perf_counter()
+            try:
+                return shard.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=shard_include)
+            finally:
+                METRICS.observe("chroma_shard_query_seconds", time.perf_counter() - start, collection=self.name, shard=index)
+
+        parts = self._map(query, enumerate(self.shards))
+        result = {"ids": []}
+        for key in include:
+            result[key] = []
+        for q in range(len(query_embeddings)):
+            candidates = (
+                (distance, s, position)
+                for s, part in enumerate(parts)
+                for position, distance in enumerate(part["distances"][q])
+            )
+            best = heapq.nsmallest(n_results, candidates)
+            result["ids"].append([parts[s]["ids"][q][position] for _, s, position in best])
+            for key in include:
+                result[key].append([parts[s][key][q][position] for _, s, position in best])
+        return result
+
+
+class ShardedClient:
+    """
+    Client Chroma che riconosce le collezioni divise in shard: get_collection restituisce una
+    ShardedCollection se la collezione è salvata in shard, altrimenti la collezione normale.
+    Con n_shards > 1, create_collection crea le nuove collezioni in n_shards shard.
+    Gli altri metodi sono quelli del client originale.
+    chroma_db_path è la cartella del database (None se sconosciuta), usata per i file accanto ad esso.
+    """
+
+    def __init__(self, client, n_shards: int | None = None, max_workers: int | None = None, chroma_db_path: str | None = None):
+        self._client = client
+        self.n_shards = n_shards
+        self.chroma_db_path = chroma_db_path
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(n_shards or 1, 4), thread_name_prefix="chroma-shard")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _shard_count(self, name: str) -> int | None:
+        """Numero di shard della collezione name, None se non è divisa in shard."""
+        try:
+            metadata = self._client.get_collection(shard_collection_name(name, 0)).metadata or {}
+        except Exception:
+            return None
+        return metadata.get("n_shards")
+
+    def _sharded(self, name: str, n_shards: int) -> ShardedCollection:
+        shards = [self._client.get_collection(shard_collection_name(name, i)) for i in range(n_shards)]
+        return ShardedCollection(name, shards, self._executor)
+
+    def get_collection(self, name: str, **kwargs):
+        try:
+            return self._client.get_collection(name, **kwargs)
+        except Exception:
+            n_shards = self._shard_count(name)
+            if n_shards is None:
+                raise
+            return self._sharded(name, n_shards)
+
+    def create_collection(self, name: str, metadata: dict | None = None, **kwargs):
+        if not self.n_shards or self.n_shards <= 1:
+            if self._shard_count(name) is not None:
+                raise ValueError(f"Collection {name} already exists (in shard)")
+            return self._client.create_collection(name, metadata=metadata, **kwargs)
+        if self._shard_count(name) is not None or self._exists(name):
+            raise ValueError(f"Collection {name} already exists")
+        shards = [
+            self._client.create_collection(
+                shard_collection_name(name, i), metadata={**(metadata or {}), "n_shards": self.n_shards, "shard": i}, **kwargs
+            )
+            for i in range(self.n_shards)
+        ]
+        return ShardedCollection(name, shards, self._executor)
+
+    def get_or_create_collection(self, name: str, metadata: dict | None = None, **kwargs):
+        try:
+            return self.get_collection(name)
+        except Exception:
+            return self.create_collection(name, metadata=metadata, **kwargs)
+
+    def delete_collection(self, name: str):
+        n_shards = self._shard_count(name)
+        if n_shards is None:
+            return self._client.delete_collection(name)
+        for i in range(n_shards):
+            self._client.delete_collection(shard_collection_name(name, i))
+
+    def _exists(self, name: str) -> bool:
+        try:
+            self._client.get_collection(name)
+            return True
+        except Exception:
+            return False
+
+
+def open_client(chroma_db_path: str = "./chroma_db", n_shards: int | None = None, max_workers: int | None = None) -> ShardedClient:
+    """
+    PersistentClient che legge in modo trasparente collezioni normali e in shard;
+    n_shards serve solo a chi crea collezioni (l'ingestion).
+    """
+    import chromadb
+
+    return ShardedClient(
+        chromadb.PersistentClient(path=chroma_db_path), n_shards=n_shards, max_workers=max_workers, chroma_db_path=chroma_db_path
+    )
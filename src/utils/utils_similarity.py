@@ -0,0 +1,64 @@
+from contextlib import nullcontext
+
+import numpy as np
+
+# threadpoolctl è opzionale: serve solo a fissare il numero di thread BLAS
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normalizza le righe a norma unitaria (float32)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _merge_top_k(best_scores, best_idx, scores, offset, k):
+    """Unisce il top-k corrente con i punteggi di un nuovo blocco di corpus."""
+    kk = min(k, scores.shape[1])
+    part = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    if best_scores is None:
+        merged_scores, merged_idx = part_scores, part + offset
+    else:
+        merged_scores = np.concatenate([best_scores, part_scores], axis=1)
+        merged_idx = np.concatenate([best_idx, part + offset], axis=1)
+    if merged_scores.shape[1] > k:
+        keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        merged_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        merged_idx = np.take_along_axis(merged_idx, keep, axis=1)
+    return merged_scores, merged_idx
+
+
+def blocked_top_k(queries: np.ndarray, corpus: np.ndarray, k: int = 5, query_block: int = 1024, corpus_block: int = 65_536, n_threads: int | None = None, normalized: bool = False):
+    """
+    Top-k esatto per similarità coseno di ogni query sul corpus.
+
+    Calcola i prodotti scalari a blocchi (query_block x corpus_block) con BLAS e seleziona
+    i migliori con argpartition, così la memoria per blocco resta limitata anche con
+    corpus grandi. Restituisce (indici (n_query, k), similarità (n_query, k)) ordinati
+    dalla più simile. normalized=True evita di rinormalizzare vettori già unitari.
+    """
+    if not normalized:
+        queries, corpus = normalize_rows(queries), normalize_rows(corpus)
+    k = min(k, len(corpus))
+    all_idx = np.empty((len(queries), k), dtype=np.int64)
+    all_scores = np.empty((len(queries), k), dtype=np.float32)
+    if k == 0:
+        return all_idx, all_scores
+
+    limits = threadpool_limits(limits=n_threads, user_api="blas") if (threadpool_limits and n_threads) else nullcontext()
+    with limits:
+        for q_start in range(0, len(queries), query_block):
+            q = np.asarray(queries[q_start:q_start + query_block], dtype=np.float32)
+            best_scores, best_idx = None, None
+            for c_start in range(0, len(corpus), corpus_block):
+                scores = q @ np.asarray(corpus[c_start:c_start + corpus_block], dtype=np.float32).T
+                best_scores, best_idx = _merge_top_k(best_scores, best_idx, scores, c_start, k)
+            order = np.argsort(-best_scores, axis=1)
+            all_scores[q_start:q_start + len(q)] = np.take_along_axis(best_scores, order, axis=1)
+            all_idx[q_start:q_start + len(q)] = np.take_along_axis(best_idx, order, axis=1)
+    return all_idx, all_scores
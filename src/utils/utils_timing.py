@@ -0,0 +1,89 @@
+import time
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def latency_summary(seconds) -> dict:
+    """Riepilogo di una serie di durate in millisecondi (media e percentili)."""
+    values = np.asarray(seconds, dtype=np.float64) * 1000
+    if len(values) == 0:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+    }
+
+
+class StageTimings:
+    """
+    Tempo totale e numero di chiamate per stage di una pipeline.
+    Gli stage girano in thread diversi, quindi gli aggiornamenti sono protetti da un lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {}
+        self.calls = {}
+        self.items = {}
+
+    def add(self, stage: str, seconds: float, items: int = 0):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            self.items[stage] = self.items.get(stage, 0) + items
+
+    @contextmanager
+    def time(self, stage: str, items: int = 0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, items)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                stage: {
+                    "seconds": round(self.seconds[stage], 4),
+                    "calls": self.calls[stage],
+                    "items": self.items[stage],
+                    "items_per_second": round(self.items[stage] / self.seconds[stage], 2) if self.items[stage] and self.seconds[stage] else None,
+                }
+                for stage in self.seconds
+            }
+
+
+@contextmanager
+def optional_timing(timings: StageTimings | None, stage: str, items: int = 0):
+    """Come StageTimings.time, ma non fa nulla se timings è None."""
+    if timings is None:
+        yield
+    else:
+        with timings.time(stage, items):
+            yield
+
+
+def timed_iter(iterable, timings: StageTimings | None, stage: str, size=None):
+    """
+    Itera su iterable registrando in timings il tempo di attesa di ogni elemento
+    (es. lettura di un chunk o risultato di un worker); size(item) conta gli elementi, 1 di default.
+    """
+    if timings is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        timings.add(stage, time.perf_counter() - start, size(item) if size else 1)
+        yield item